@@ -0,0 +1,130 @@
+"""Precomputed attendance counters.
+
+StudentAttendanceSummary holds one row per student (present days, last
+present date, current and longest streak of consecutive school days).
+ClassDailyAttendance holds one row per class and school day (students
+present, students enrolled when the day started) and ClassAttendanceTotals
+their running sums per class. All are created by migrations and kept up to
+date by triggers, so every attendance insert, change or delete updates
+them in the same transaction. Pages read these rows instead of counting
+Attendance history.
+"""
+from bisect import bisect_left
+from datetime import date
+from itertools import groupby
+
+
+def rebuild_student_summary(cursor):
+    """Recompute StudentAttendanceSummary from Attendance (same rules as the triggers)"""
+    school_days = [row[0] for row in cursor.execute("SELECT Date FROM SchoolDays ORDER BY Date")]
+    rows = cursor.execute("""
+        SELECT StudentID, Date FROM Attendance
+        WHERE Status = 'Present' AND StudentID IS NOT NULL
+        ORDER BY StudentID, Date
+    """).fetchall()
+
+    summaries = []
+    for student_id, days in groupby(rows, key=lambda row: row[0]):
+        present_days = current = longest = 0
+        last_present = None
+        for _, day in days:
+            i = bisect_left(school_days, day)
+            previous_school_day = school_days[i - 1] if i > 0 else None
+            current = current + 1 if last_present is not None and last_present == previous_school_day else 1
+            longest = max(longest, current)
+            present_days += 1
+            last_present = day
+        summaries.append((student_id, present_days, last_present, current, longest))
+
+    cursor.execute("DELETE FROM StudentAttendanceSummary")
+    cursor.executemany("""
+        INSERT INTO StudentAttendanceSummary (StudentID, PresentDays, LastPresentDate, CurrentStreak, LongestStreak)
+        VALUES (?, ?, ?, ?, ?)
+    """, summaries)
+    return len(summaries)
+
+
+def present_days(conn, student_id):
+    """Days the student was marked present"""
+    row = conn.execute("SELECT PresentDays FROM StudentAttendanceSummary WHERE StudentID = ?",
+                       (student_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def student_summary(conn, student_id, today=None):
+    """Present days, last present date and streaks of one student.
+
+    The stored streak ends at the last present date; it counts as broken
+    (0) once the student missed the last school day before today.
+    """
+    row = conn.execute("""
+        SELECT PresentDays, LastPresentDate, CurrentStreak, LongestStreak
+        FROM StudentAttendanceSummary WHERE StudentID = ?
+    """, (student_id,)).fetchone()
+    present, last_present, current, longest = row or (0, None, 0, 0)
+
+    previous_school_day = conn.execute("SELECT MAX(Date) FROM SchoolDays WHERE Date < ?",
+                                       (str(today or date.today()),)).fetchone()[0]
+    if last_present is None or (previous_school_day is not None and last_present < previous_school_day):
+        current = 0
+    return {
+        "present_days": present,
+        "last_present_date": last_present,
+        "current_streak": current,
+        "longest_streak": longest,
+    }
+
+
+def rebuild_class_daily(cursor):
+    """Recompute the present counts of ClassDailyAttendance: every class on every school day.
+
+    Enrolled counts already recorded are kept. Missing rows get today's class
+    sizes: Students has no enrollment history, so days from before the table
+    existed are approximated with the class sizes at migration time.
+    """
+    cursor.execute("UPDATE ClassDailyAttendance SET Present = 0 WHERE Present != 0")
+    cursor.execute("""
+        INSERT OR IGNORE INTO ClassDailyAttendance (Class, Date, Present, Enrolled)
+        SELECT c.Class, d.Date, 0, c.Enrolled
+        FROM SchoolDays d, (SELECT Class, COUNT(*) AS Enrolled FROM Students GROUP BY Class) c
+    """)
+    cursor.execute("""
+        INSERT INTO ClassDailyAttendance (Class, Date, Present, Enrolled)
+        SELECT Class, Date, COUNT(*), (SELECT COUNT(*) FROM Students s WHERE s.Class = a.Class)
+        FROM Attendance a
+        WHERE Status = 'Present'
+        GROUP BY Class, Date
+        ON CONFLICT (Class, Date) DO UPDATE SET Present = excluded.Present
+    """)
+    return cursor.execute("SELECT COUNT(*) FROM ClassDailyAttendance").fetchone()[0]
+
+
+def class_day(conn, student_class, day=None):
+    """(present, enrolled) of a class on `day` (default today), (0, 0) before the day's first mark"""
+    row = conn.execute("SELECT Present, Enrolled FROM ClassDailyAttendance WHERE Class = ? AND Date = ?",
+                       (student_class, str(day or date.today()))).fetchone()
+    return row or (0, 0)
+
+
+def rebuild_class_totals(cursor):
+    """Recompute ClassAttendanceTotals from ClassDailyAttendance"""
+    cursor.execute("DELETE FROM ClassAttendanceTotals")
+    cursor.execute("""
+        INSERT INTO ClassAttendanceTotals (Class, Present, Enrolled)
+        SELECT Class, SUM(Present), SUM(Enrolled) FROM ClassDailyAttendance GROUP BY Class
+    """)
+    return cursor.execute("SELECT COUNT(*) FROM ClassAttendanceTotals").fetchone()[0]
+
+
+def class_attendance_rate(conn, student_class):
+    """Percentage of enrolled student-days the class was present, over all school days"""
+    row = conn.execute("SELECT Present, Enrolled FROM ClassAttendanceTotals WHERE Class = ?",
+                       (student_class,)).fetchone()
+    present, enrolled = row or (0, 0)
+    return present / enrolled * 100 if enrolled else 0
+
+
+def present_on(conn, day=None):
+    """Students marked present in the whole school on `day` (default today)"""
+    return conn.execute("SELECT COALESCE(SUM(Present), 0) FROM ClassDailyAttendance WHERE Date = ?",
+                        (str(day or date.today()),)).fetchone()[0]
@@ -0,0 +1,178 @@
+"""Shared SQLite connections for the web app and the face recognition backend.
+
+Connections are kept in a small pool per database file instead of being
+opened for every request. Each connection gets its pragmas (WAL journal,
+synchronous=NORMAL, memory-mapped I/O, a larger page cache) once, when it
+is opened. A connection is only ever used by one thread at a time: it is
+checked out, used, and returned, and anything left uncommitted is rolled
+back on return so a failed request cannot leak a transaction. When the
+file is replaced on disk (a restored backup), connections to the old file
+are dropped at the next checkout.
+
+The schema is not changed by merely opening a database, a pool only warns
+when migrations are pending. Entry points apply them with upgrade_schema();
+the web app does so in init_app, however it is started (app.py, flask run,
+gunicorn).
+
+Flask routes use get_db(), which checks out one connection per request
+and returns it at teardown (see init_app). Other code uses
+
+    with connection(db_path) as conn:
+        ...
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from Backend.Database.Migrations import LATEST_VERSION, migrate, schema_version
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "school_portal.db")
+
+# Applied to every new connection
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -16000),  # negative means KiB, ~16 MB
+    ("busy_timeout", 5000),
+)
+# Idle connections kept per database, extra ones are closed on return
+MAX_IDLE_CONNECTIONS = 8
+
+
+class ConnectionPool:
+    """Pool of ready-to-use connections to one database file"""
+
+    def __init__(self, database=DB_PATH, max_idle=MAX_IDLE_CONNECTIONS):
+        self.database = database
+        self.max_idle = max_idle
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.file_id = self._file_id()
+        self.file_ids = {}  # connection -> file_id of the file it was opened on
+
+    def _file_id(self):
+        try:
+            st = os.stat(self.database)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _open(self):
+        # check_same_thread is off because connections move between threads,
+        # but the pool never hands one connection to two threads at once
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        for name, value in PRAGMAS:
+            conn.execute(f"PRAGMA {name}={value}")
+        self.opened += 1
+        self.file_ids[conn] = self._file_id()
+        return conn
+
+    def _close(self, conn):
+        self.file_ids.pop(conn, None)
+        conn.close()
+
+    def acquire(self):
+        file_id = self._file_id()
+        if file_id != self.file_id:
+            self.file_id = file_id
+            self.close_all()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._close(conn)
+            return
+        if self.file_ids.get(conn) == self.file_id and self.idle.qsize() < self.max_idle:
+            self.idle.put(conn)
+        else:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database=None):
+    """The pool for a database file (one per absolute path, default DB_PATH)"""
+    key = os.path.abspath(database or DB_PATH)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(key)
+            with pool.connection() as conn:
+                version = schema_version(conn)
+            if version < LATEST_VERSION:
+                print(f"{key} is at schema version {version} of {LATEST_VERSION}, "
+                      f"run: python -m Backend.Database.Migrations")
+            _pools[key] = pool
+        return pool
+
+
+def upgrade_schema(database=None):
+    """Apply pending migrations (see Migrations), returns the schema version.
+
+    Runs under the pool lock, so no other thread of this process gets its
+    first connection to the database before the schema is current.
+    """
+    key = os.path.abspath(database or DB_PATH)
+    with _pools_lock:
+        pool = _pools.get(key) or ConnectionPool(key)
+        with pool.connection() as conn:
+            version = migrate(conn)
+        _pools[key] = pool
+    return version
+
+
+def connection(database=None):
+    """Context manager lending a pooled connection to `database`"""
+    return get_pool(database).connection()
+
+
+def get_db(database=None):
+    """Connection for the current Flask request, returned to the pool at teardown"""
+    from flask import g
+
+    if "db" not in g:
+        g.db_pool = get_pool(database)
+        g.db = g.db_pool.acquire()
+    return g.db
+
+
+def _release_db(exception=None):
+    from flask import g
+
+    conn = g.pop("db", None)
+    pool = g.pop("db_pool", None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app, database=None):
+    """Migrate the database, then return each request's connection to the pool
+    at teardown, even when the request failed"""
+    upgrade_schema(database)
+    app.teardown_appcontext(_release_db)
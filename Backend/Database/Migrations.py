@@ -0,0 +1,400 @@
+"""Versioned schema migrations for school_portal.db.
+
+The schema version is kept in PRAGMA user_version. migrate() applies every
+migration newer than that version, each in its own transaction together
+with the version bump, so an interrupted upgrade resumes where it stopped.
+New migrations are appended to MIGRATIONS; released ones are never edited.
+Migrations only run when asked to: DataAccess.upgrade_schema() at startup
+(the web app calls it from DataAccess.init_app), create_db, or
+python -m Backend.Database.Migrations [--db path].
+"""
+import argparse
+import os
+import sqlite3
+
+from Backend.Database.AttendanceStats import rebuild_class_daily, rebuild_class_totals, rebuild_student_summary
+
+
+def _add_attendance_indexes(cursor):
+    # Per-student counts (ratio, attend_percentage, analytics joins) read only the index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_status ON Attendance (StudentID, Status)")
+    # Today's attendance (government_reports, teacher_analytics, load_marked_students)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_status ON Attendance (Date, Status, StudentID)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_class_date ON Attendance (Class, Date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_class ON Students (Class)")
+
+
+def _unique_attendance_per_day(cursor):
+    # Keep one row per student and day, a 'Present' one when there is any
+    cursor.execute("""
+        DELETE FROM Attendance
+        WHERE AttendanceID NOT IN (
+            SELECT COALESCE(MIN(CASE WHEN Status = 'Present' THEN AttendanceID END), MIN(AttendanceID))
+            FROM Attendance
+            GROUP BY StudentID, Date
+        )
+    """)
+    if cursor.rowcount > 0:
+        print(f"Removed {cursor.rowcount} duplicate attendance rows")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_student_date ON Attendance (StudentID, Date)")
+
+
+# Streak rule shared by both branches of the insert trigger: the streak goes on
+# when the previous present day is the school day right before this one
+_NEXT_STREAK = """
+    CASE
+        WHEN LastPresentDate >= NEW.Date THEN CurrentStreak
+        WHEN LastPresentDate = (SELECT MAX(Date) FROM SchoolDays WHERE Date < NEW.Date) THEN CurrentStreak + 1
+        ELSE 1
+    END
+"""
+
+
+def _student_attendance_summary(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS StudentAttendanceSummary (
+            StudentID INTEGER PRIMARY KEY,
+            PresentDays INTEGER NOT NULL DEFAULT 0,
+            LastPresentDate TEXT,
+            CurrentStreak INTEGER NOT NULL DEFAULT 0,  -- school days in a row up to LastPresentDate
+            LongestStreak INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    rebuild_student_summary(cursor)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_insert
+        AFTER INSERT ON Attendance
+        WHEN NEW.Status = 'Present' AND NEW.StudentID IS NOT NULL
+        BEGIN
+            INSERT INTO StudentAttendanceSummary
+                (StudentID, PresentDays, LastPresentDate, CurrentStreak, LongestStreak)
+            VALUES (NEW.StudentID, 1, NEW.Date, 1, 1)
+            ON CONFLICT (StudentID) DO UPDATE SET
+                PresentDays = PresentDays + 1,
+                CurrentStreak = {_NEXT_STREAK},
+                LongestStreak = MAX(LongestStreak, {_NEXT_STREAK}),
+                LastPresentDate = MAX(COALESCE(LastPresentDate, ''), NEW.Date);
+        END
+    """)
+    # Deletes only fix the count and last date, rebuild_student_summary recomputes streaks
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_delete
+        AFTER DELETE ON Attendance
+        WHEN OLD.Status = 'Present'
+        BEGIN
+            UPDATE StudentAttendanceSummary
+            SET PresentDays = PresentDays - 1,
+                LastPresentDate = (SELECT MAX(Date) FROM Attendance
+                                   WHERE StudentID = OLD.StudentID AND Status = 'Present')
+            WHERE StudentID = OLD.StudentID;
+        END
+    """)
+
+
+def _class_daily_attendance(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ClassDailyAttendance (
+            Class TEXT NOT NULL,
+            Date TEXT NOT NULL,
+            Present INTEGER NOT NULL DEFAULT 0,
+            Enrolled INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (Class, Date)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_class_daily_date ON ClassDailyAttendance (Date)")
+    rebuild_class_daily(cursor)
+    # A new school day starts every class at 0 present
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS class_daily_school_day
+        AFTER INSERT ON SchoolDays
+        BEGIN
+            INSERT OR IGNORE INTO ClassDailyAttendance (Class, Date, Present, Enrolled)
+            SELECT Class, NEW.Date, 0, COUNT(*) FROM Students GROUP BY Class;
+        END
+    """)
+    # Each mark counts for its class and day, and refreshes the class size
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS class_daily_insert
+        AFTER INSERT ON Attendance
+        WHEN NEW.Status = 'Present'
+        BEGIN
+            INSERT INTO ClassDailyAttendance (Class, Date, Present, Enrolled)
+            VALUES (NEW.Class, NEW.Date, 1, (SELECT COUNT(*) FROM Students WHERE Class = NEW.Class))
+            ON CONFLICT (Class, Date) DO UPDATE SET
+                Present = Present + 1,
+                Enrolled = excluded.Enrolled;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS class_daily_delete
+        AFTER DELETE ON Attendance
+        WHEN OLD.Status = 'Present'
+        BEGIN
+            UPDATE ClassDailyAttendance SET Present = Present - 1
+            WHERE Class = OLD.Class AND Date = OLD.Date;
+        END
+    """)
+
+
+# Recomputes one student's summary row from Attendance, with the streak rule
+# of rebuild_student_summary: present days are split into runs where each day
+# follows the school day right before it; CurrentStreak is the latest run.
+# Used when a mark is deleted or changed, which can split or join runs.
+# An upsert, not INSERT OR REPLACE: an UPDATE OR IGNORE firing the trigger
+# would turn that into an ignored insert.
+_RECOMPUTE_SUMMARY = """
+    INSERT INTO StudentAttendanceSummary
+        (StudentID, PresentDays, LastPresentDate, CurrentStreak, LongestStreak)
+    SELECT StudentID, PresentDays, LastPresentDate, CurrentStreak, LongestStreak FROM (
+        SELECT {student} AS StudentID, COALESCE(SUM(Days), 0) AS PresentDays, MAX(LastDate) AS LastPresentDate,
+               COALESCE(MAX(LatestRun), 0) AS CurrentStreak, COALESCE(MAX(Days), 0) AS LongestStreak
+        FROM (
+            SELECT COUNT(*) AS Days, MAX(Date) AS LastDate,
+                   FIRST_VALUE(COUNT(*)) OVER (ORDER BY MAX(Date) DESC) AS LatestRun
+            FROM (
+                SELECT Date, SUM(NewRun) OVER (ORDER BY Date) AS Run
+                FROM (
+                    SELECT a.Date, LAG(a.Date) OVER (ORDER BY a.Date) IS NOT
+                           (SELECT MAX(d.Date) FROM SchoolDays d WHERE d.Date < a.Date) AS NewRun
+                    FROM Attendance a
+                    WHERE a.StudentID = {student} AND a.Status = 'Present'
+                )
+            )
+            GROUP BY Run
+        )
+    )
+    WHERE StudentID IS NOT NULL
+    ON CONFLICT (StudentID) DO UPDATE SET
+        PresentDays = excluded.PresentDays,
+        LastPresentDate = excluded.LastPresentDate,
+        CurrentStreak = excluded.CurrentStreak,
+        LongestStreak = excluded.LongestStreak;
+"""
+
+
+def _attendance_updates(cursor):
+    # Marks after the last present day still extend the streak incrementally,
+    # backdated ones (which can join two runs) recompute the row
+    cursor.execute("DROP TRIGGER IF EXISTS attendance_summary_insert")
+    in_order = """NEW.Date > COALESCE((SELECT LastPresentDate FROM StudentAttendanceSummary
+                                       WHERE StudentID = NEW.StudentID), '')"""
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_insert
+        AFTER INSERT ON Attendance
+        WHEN NEW.Status = 'Present' AND NEW.StudentID IS NOT NULL AND {in_order}
+        BEGIN
+            INSERT INTO StudentAttendanceSummary
+                (StudentID, PresentDays, LastPresentDate, CurrentStreak, LongestStreak)
+            VALUES (NEW.StudentID, 1, NEW.Date, 1, 1)
+            ON CONFLICT (StudentID) DO UPDATE SET
+                PresentDays = PresentDays + 1,
+                CurrentStreak = {_NEXT_STREAK},
+                LongestStreak = MAX(LongestStreak, {_NEXT_STREAK}),
+                LastPresentDate = NEW.Date;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_backdated
+        AFTER INSERT ON Attendance
+        WHEN NEW.Status = 'Present' AND NEW.StudentID IS NOT NULL AND NOT {in_order}
+        BEGIN
+            {_RECOMPUTE_SUMMARY.format(student="NEW.StudentID")}
+        END
+    """)
+    # Deletes recompute the whole row (the old trigger left streaks stale)
+    cursor.execute("DROP TRIGGER IF EXISTS attendance_summary_delete")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_delete
+        AFTER DELETE ON Attendance
+        WHEN OLD.Status = 'Present'
+        BEGIN
+            {_RECOMPUTE_SUMMARY.format(student="OLD.StudentID")}
+        END
+    """)
+    # A status change (or a mark moved to another student or day) recomputes both students
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_update
+        AFTER UPDATE OF StudentID, Date, Status ON Attendance
+        WHEN (OLD.Status = 'Present' OR NEW.Status = 'Present')
+             AND (OLD.Status IS NOT NEW.Status OR OLD.StudentID IS NOT NEW.StudentID OR OLD.Date IS NOT NEW.Date)
+        BEGIN
+            {_RECOMPUTE_SUMMARY.format(student="OLD.StudentID")}
+            {_RECOMPUTE_SUMMARY.format(student="NEW.StudentID")}
+        END
+    """)
+    # The mark leaves its old class and day and counts for the new ones
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS class_daily_update
+        AFTER UPDATE OF Class, Date, Status ON Attendance
+        WHEN (OLD.Status = 'Present' OR NEW.Status = 'Present')
+             AND (OLD.Status IS NOT NEW.Status OR OLD.Class IS NOT NEW.Class OR OLD.Date IS NOT NEW.Date)
+        BEGIN
+            UPDATE ClassDailyAttendance SET Present = Present - 1
+            WHERE OLD.Status = 'Present' AND Class = OLD.Class AND Date = OLD.Date;
+            INSERT INTO ClassDailyAttendance (Class, Date, Present, Enrolled)
+            SELECT NEW.Class, NEW.Date, 1, (SELECT COUNT(*) FROM Students WHERE Class = NEW.Class)
+            WHERE NEW.Status = 'Present'
+            ON CONFLICT (Class, Date) DO UPDATE SET Present = Present + 1;
+        END
+    """)
+    # Updates made before these triggers existed were not counted
+    rebuild_student_summary(cursor)
+    rebuild_class_daily(cursor)
+
+
+def _class_attendance_totals(cursor):
+    # Enrolled is the class size when the day's row is created, normally by
+    # class_daily_school_day when the school day starts; marks only count.
+    # Rows from before this migration keep the sizes of their last mark (see
+    # rebuild_class_daily), there is no enrollment history to backfill from.
+    cursor.execute("DROP TRIGGER IF EXISTS class_daily_insert")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS class_daily_insert
+        AFTER INSERT ON Attendance
+        WHEN NEW.Status = 'Present'
+        BEGIN
+            INSERT INTO ClassDailyAttendance (Class, Date, Present, Enrolled)
+            VALUES (NEW.Class, NEW.Date, 1, (SELECT COUNT(*) FROM Students WHERE Class = NEW.Class))
+            ON CONFLICT (Class, Date) DO UPDATE SET Present = Present + 1;
+        END
+    """)
+
+    # Running sums of ClassDailyAttendance per class, for the attendance rate
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ClassAttendanceTotals (
+            Class TEXT PRIMARY KEY,
+            Present INTEGER NOT NULL DEFAULT 0,
+            Enrolled INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    rebuild_class_totals(cursor)
+    add_new = """
+        INSERT INTO ClassAttendanceTotals (Class, Present, Enrolled)
+        VALUES (NEW.Class, NEW.Present, NEW.Enrolled)
+        ON CONFLICT (Class) DO UPDATE SET
+            Present = Present + excluded.Present,
+            Enrolled = Enrolled + excluded.Enrolled;
+    """
+    remove_old = """
+        UPDATE ClassAttendanceTotals
+        SET Present = Present - OLD.Present, Enrolled = Enrolled - OLD.Enrolled
+        WHERE Class = OLD.Class;
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS class_totals_insert
+        AFTER INSERT ON ClassDailyAttendance
+        BEGIN
+            {add_new}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS class_totals_update
+        AFTER UPDATE ON ClassDailyAttendance
+        BEGIN
+            {remove_old}
+            {add_new}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS class_totals_delete
+        AFTER DELETE ON ClassDailyAttendance
+        BEGIN
+            {remove_old}
+        END
+    """)
+
+
+def _gallery_change_log(cursor):
+    # Every insert, update or delete on face_encodings, and every change of a
+    # student's class, appends the affected id with an increasing seq number,
+    # which the gallery cache (FaceRecognition.GalleryCache) uses as its
+    # watermark. face_encodings_log_info holds a random stamp, so a recreated
+    # database is never mistaken for the one a snapshot was taken from.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS face_encodings_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS face_encodings_log_info (stamp TEXT NOT NULL)")
+    cursor.execute("""
+        INSERT INTO face_encodings_log_info (stamp)
+        SELECT lower(hex(randomblob(8))) WHERE NOT EXISTS (SELECT 1 FROM face_encodings_log_info)
+    """)
+    # (trigger, event, ids logged)
+    for name, event, ids in [
+        ("face_encodings_log_insert", "INSERT ON face_encodings", ["NEW.id"]),
+        ("face_encodings_log_update", "UPDATE ON face_encodings", ["OLD.id", "NEW.id"]),
+        ("face_encodings_log_delete", "DELETE ON face_encodings", ["OLD.id"]),
+        ("students_class_log_insert", "INSERT ON Students", ["NEW.StudentID"]),
+        ("students_class_log_update", "UPDATE OF StudentID, Class ON Students", ["OLD.StudentID", "NEW.StudentID"]),
+        ("students_class_log_delete", "DELETE ON Students", ["OLD.StudentID"]),
+    ]:
+        inserts = "".join(f"INSERT INTO face_encodings_log (id) VALUES ({i});" for i in ids)
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} BEGIN {inserts} END")
+
+
+# (version, description, function(cursor)), in order
+MIGRATIONS = [
+    (1, "indexes for attendance queries", _add_attendance_indexes),
+    (2, "one attendance row per student and day", _unique_attendance_per_day),
+    (3, "per-student attendance summary", _student_attendance_summary),
+    (4, "daily attendance per class", _class_daily_attendance),
+    (5, "attendance updates and deletes keep summaries exact", _attendance_updates),
+    (6, "enrollment fixed per school day, running class totals", _class_attendance_totals),
+    (7, "change log for the gallery cache", _gallery_change_log),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+# First version with face_encodings_log, required by the gallery cache
+GALLERY_CHANGE_LOG_VERSION = 7
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring the database up to LATEST_VERSION, returns the resulting version.
+
+    A database without the Attendance table (create_db not run yet) is left
+    alone.
+    """
+    version = schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Attendance'").fetchone()
+    if not exists:
+        return version
+
+    for number, description, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the lock
+            if schema_version(conn) >= number:
+                conn.rollback()
+                continue
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(number)}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        print(f"Database migrated to version {number}: {description}")
+    return schema_version(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="apply pending schema migrations")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "school_portal.db"))
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist (NewDataFile.create_db creates a new database)")
+
+    conn = sqlite3.connect(args.db)
+    try:
+        print(f"{args.db}: schema version {migrate(conn)} of {LATEST_VERSION}")
+    finally:
+        conn.close()
@@ -1,7 +1,9 @@
 import sqlite3
 
-def create_db():
-    conn = sqlite3.connect("school_portal.db")
+from Backend.Database.Migrations import migrate
+
+def create_db(database="school_portal.db", upgrade=True):
+    conn = sqlite3.connect(database)
     cursor = conn.cursor()
 
     # Students table
@@ -85,6 +87,11 @@ def create_db():
         )
     ''')
 
+    # Indexes and constraints
+    if upgrade:
+        migrate(conn)
+    conn.close()
+
     print("Database created successfully!")
 
 def check_database_status():
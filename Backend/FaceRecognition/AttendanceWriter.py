@@ -0,0 +1,139 @@
+"""Write-behind queue for attendance marks.
+
+The recognition loop only calls submit(), which is an in-memory set lookup
+and a queue put. A background thread collects the marks and writes them in
+batched transactions, so no frame waits on SQLite. Each (student, date) is
+queued at most once: the writer keeps the set of students marked per day,
+seeded from the database the first time that day is seen, so repeat
+recognitions are rejected in O(1). close() flushes whatever is left.
+"""
+import queue
+import threading
+from datetime import date
+
+# Wait this long for more marks before writing a batch
+FLUSH_INTERVAL = 0.5
+MAX_BATCH = 200
+# A failed batch is retried this many times before the marks are dropped
+MAX_RETRIES = 3
+
+
+class AttendanceWriter:
+    """Background writer around write_batch(student_ids, day).
+
+    write_batch must write the whole batch in one transaction and raise on
+    failure; the batch is then retried on the next round. load_marked(day)
+    returns the student ids already marked on that day; today's are loaded
+    right away.
+    """
+
+    def __init__(self, write_batch, load_marked=None, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.write_batch = write_batch
+        self.load_marked = load_marked
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        self.marked = {}  # day -> student ids marked or queued that day
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.duplicates = 0
+        self.written = 0
+        self.batches = 0
+        self.in_flight = 0  # marks taken from the queue but not written yet
+        with self.lock:
+            self._marked_on(str(date.today()))
+        self.thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self.thread.start()
+
+    def _marked_on(self, day):
+        """The set for `day`, loaded on first use (call with the lock held)"""
+        marked = self.marked.get(day)
+        if marked is None:
+            marked = self.marked[day] = set(self.load_marked(day)) if self.load_marked else set()
+            # Only today matters to the camera loop, older days are not kept
+            for old_day in [d for d in self.marked if d < day]:
+                del self.marked[old_day]
+        return marked
+
+    def is_marked(self, student_id, day=None):
+        """True if the student is already marked (or queued) for the day"""
+        with self.lock:
+            return student_id in self._marked_on(str(day or date.today()))
+
+    def submit(self, student_id, day=None):
+        """Queue a mark, returns False if this (student, day) was already marked or queued"""
+        day = str(day or date.today())
+        with self.lock:
+            marked = self._marked_on(day)
+            if student_id in marked:
+                self.duplicates += 1
+                return False
+            marked.add(student_id)
+        self.pending.put((student_id, day))
+        return True
+
+    def _collect(self, timeout):
+        try:
+            batch = [self.pending.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        by_day = {}
+        for student_id, day in batch:
+            by_day.setdefault(day, []).append(student_id)
+        for day, student_ids in by_day.items():
+            self.write_batch(student_ids, day)
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self):
+        retry, attempts = [], 0
+        while True:
+            stopping = self.stop_event.is_set()
+            batch = retry + self._collect(0 if stopping else self.flush_interval)
+            if not batch:
+                if stopping:
+                    return
+                continue
+            self.in_flight = len(batch)
+            try:
+                self._write(batch)
+                retry, attempts = [], 0
+                self.in_flight = 0
+            except Exception as e:
+                attempts += 1
+                print(f"Attendance write failed ({attempts}/{MAX_RETRIES}): {e}")
+                if attempts >= MAX_RETRIES:
+                    with self.lock:
+                        for student_id, day in batch:  # let a later recognition try again
+                            self.marked.get(day, set()).discard(student_id)
+                    if stopping:
+                        return  # in_flight keeps the count of the lost batch
+                    retry, attempts = [], 0
+                    self.in_flight = 0
+                else:
+                    retry = batch
+                    self.stop_event.wait(self.flush_interval)
+
+    def close(self, timeout=10):
+        """Write everything still queued and stop the thread.
+
+        Returns the number of marks left unwritten (0 normally): those the
+        thread did not get to within `timeout`, e.g. while the database is
+        locked, or that failed MAX_RETRIES times. They are reported, not
+        written from here, since this thread would wait on the same lock.
+        """
+        self.stop_event.set()
+        self.thread.join(timeout)
+        unwritten = self.pending.qsize() + self.in_flight
+        if unwritten:
+            reason = f"still busy after {timeout} s" if self.thread.is_alive() else "gave up"
+            print(f"Attendance writer {reason}: {unwritten} marks were not written")
+        return unwritten
@@ -0,0 +1,367 @@
+"""Performance benchmarks for the face recognition backend.
+
+Usage:
+    python -m Backend.FaceRecognition.Benchmark gallery --size 20000
+    python -m Backend.FaceRecognition.Benchmark db-write --rows 2000
+    python -m Backend.FaceRecognition.Benchmark replay classroom.mp4 --expected 101,102,103
+    python -m Backend.FaceRecognition.Benchmark detect-scale classroom.mp4 --scales 1,0.75,0.5
+    python -m Backend.FaceRecognition.Benchmark ear --faces 30
+    python -m Backend.FaceRecognition.Benchmark attendance-db --students 3000 --days 220
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from Backend.FaceRecognition.GalleryIndex import ENCODING_DIM, build_gallery
+from Backend.FaceRecognition.Pipeline import StageStats
+
+
+def synthetic_gallery(size, family_size=10, seed=0):
+    """Random encodings with a face-like distance structure.
+
+    Identities come in overlapping families of look-alikes (cluster centers
+    ~0.7 apart, members ~0.55 from each other), so distances between
+    different people span ~0.5 to ~1.2 with a median near 0.9, like dlib
+    encodings. Clusters overlap, so an IVF cell boundary can fall between a
+    query and its match and recall depends on the number of probed cells.
+    """
+    rng = np.random.default_rng(seed)
+    n_families = max(1, size // family_size)
+    # Per-dimension scale so that the distance between two draws is the spread
+    centers = rng.normal(0, 0.7 / np.sqrt(2 * ENCODING_DIM), (n_families, ENCODING_DIM))
+    members = rng.integers(0, n_families, size)
+    encodings = centers[members] + rng.normal(0, 0.55 / np.sqrt(2 * ENCODING_DIM), (size, ENCODING_DIM))
+    return encodings.astype(np.float32), list(range(size))
+
+
+def synthetic_queries(encodings, n_queries, noise=0.4, seed=1):
+    """Noisy re-captures of random gallery entries (~`noise` from the stored
+    encoding, a typical same-person distance), returns (queries, true indices)"""
+    rng = np.random.default_rng(seed)
+    truth = rng.integers(0, encodings.shape[0], n_queries)
+    queries = encodings[truth] + rng.normal(0, noise / np.sqrt(ENCODING_DIM), (n_queries, ENCODING_DIM))
+    return queries.astype(np.float32), truth
+
+
+def time_queries(gallery, queries):
+    """Query one encoding at a time (like the camera loop), returns (results, latencies in ms)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(gallery.query(query, k=1, tolerance=False))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def benchmark_gallery(size, n_queries=500, n_probes=(1, 2, 4, 8, 16, 32)):
+    """Recall and latency of the IVF backend against the exact scan"""
+    encodings, ids = synthetic_gallery(size)
+    queries, _ = synthetic_queries(encodings, n_queries)
+
+    start = time.perf_counter()
+    exact = build_gallery(encodings, ids, backend="exact")
+    print(f"Gallery size: {size}, queries: {n_queries}")
+    print(f"exact build: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    ivf = build_gallery(encodings, ids, backend="ivf")
+    print(f"ivf build:   {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    exact_results, latencies = time_queries(exact, queries)
+    exact_top = [r[0][0] for r in exact_results]
+    print(f"{'backend':<14}{'recall@1':>10}{'mean ms':>10}{'p95 ms':>10}")
+    print(f"{'exact':<14}{1.0:>10.3f}{latencies.mean():>10.3f}{np.percentile(latencies, 95):>10.3f}")
+
+    for n_probe in n_probes:
+        ivf.n_probe = n_probe
+        results, latencies = time_queries(ivf, queries)
+        recall = np.mean([r[0][0] == e for r, e in zip(results, exact_top)])
+        name = f"ivf probe={n_probe}"
+        print(f"{name:<14}{recall:>10.3f}{latencies.mean():>10.3f}{np.percentile(latencies, 95):>10.3f}")
+
+
+def benchmark_db_write(rows):
+    """Per-student save_encoding_to_db against bulk_upsert_encodings on a scratch DB"""
+    from Backend.FaceRecognition.EncodingGenerator import bulk_upsert_encodings, save_encoding_to_db
+
+    encodings, ids = synthetic_gallery(rows)
+    items = list(zip(ids, encodings.astype(np.float64)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(database)
+        conn.execute("CREATE TABLE face_encodings (id INTEGER PRIMARY KEY, encoding BLOB NOT NULL)")
+        conn.commit()
+        conn.close()
+
+        start = time.perf_counter()
+        for student_id, encoding in items:
+            save_encoding_to_db(student_id, encoding, database)
+        elapsed = time.perf_counter() - start
+        print(f"per-row: {rows / elapsed:.0f} rows/s ({elapsed:.2f} s)")
+
+        bulk_rate = bulk_upsert_encodings(items, database=database)
+        print(f"bulk:    {bulk_rate:.0f} rows/s ({rows / bulk_rate:.3f} s)")
+
+
+def benchmark_replay(source, expected=None, student_class=None, realtime=True):
+    """Run a recorded clip (or any frame source) through run_face_attendance headless.
+
+    Reports throughput and latency per pipeline stage and, when the students
+    in the clip are known, how many were recognized and how many matches were
+    wrong. Attendance is not written to the database.
+    """
+    from Backend.FaceRecognition.FaceMain import run_face_attendance
+    from Backend.FaceRecognition.FrameSource import open_source
+
+    stats = StageStats()
+    recognized = []
+    start = time.perf_counter()
+    run_face_attendance(student_class, source=open_source(source, realtime), headless=True,
+                        stats=stats, on_recognized=recognized.append, record_attendance=False)
+    elapsed = time.perf_counter() - start
+
+    print(f"Replayed {source} in {elapsed:.1f} s")
+    print(f"{'stage':<18}{'count':>8}{'fps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in stats.summary().items():
+        print(f"{stage:<18}{s['count']:>8}{s['fps']:>8.1f}{s['p50_ms']:>10.1f}"
+              f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+
+    recognized_ids = [student["id"] for student in recognized]
+    print(f"Recognitions: {len(recognized_ids)} ({len(set(recognized_ids))} distinct students)")
+    if expected:
+        expected = set(expected)
+        correct = [i for i in recognized_ids if i in expected]
+        found = expected.intersection(recognized_ids)
+        precision = len(correct) / len(recognized_ids) if recognized_ids else 0.0
+        print(f"Recall:    {len(found)}/{len(expected)} = {len(found) / len(expected):.3f}")
+        print(f"Precision: {len(correct)}/{len(recognized_ids)} = {precision:.3f}")
+        missed = sorted(expected - found)
+        wrong = sorted(set(recognized_ids) - expected)
+        if missed:
+            print(f"Missed:    {missed}")
+        if wrong:
+            print(f"Wrong:     {wrong}")
+
+
+def benchmark_detection_scale(source, scales=(1.0, 0.75, 0.5, 0.35), max_frames=200):
+    """HOG detection speed and recall at several detection scales.
+
+    Detections on the full-resolution frame are the reference; a face counts
+    as found at a given scale when a remapped box overlaps it by IoU >= 0.5.
+    """
+    import cv2
+    import dlib
+    from Backend.FaceRecognition.FrameSource import open_source
+    from Backend.FaceRecognition.Tracking import detect_faces, iou
+
+    cap = open_source(source, realtime=False)
+    grays = []
+    while len(grays) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        grays.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+    if not grays:
+        print(f"No frames read from {source}")
+        return
+
+    detector = dlib.get_frontal_face_detector()
+    reference = [detect_faces(detector, gray) for gray in grays]
+    total = sum(len(rects) for rects in reference)
+    print(f"{len(grays)} frames, {total} faces at full resolution")
+    print(f"{'scale':>6}{'fps':>9}{'mean ms':>10}{'p95 ms':>10}{'recall':>9}")
+
+    for scale in scales:
+        latencies, found = [], 0
+        for gray, expected in zip(grays, reference):
+            start = time.perf_counter()
+            rects = detect_faces(detector, gray, scale)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += sum(1 for face in expected if any(iou(face, rect) >= 0.5 for rect in rects))
+        latencies = np.array(latencies)
+        recall = found / total if total else float("nan")
+        print(f"{scale:>6.2f}{1000 / latencies.mean():>9.1f}{latencies.mean():>10.2f}"
+              f"{np.percentile(latencies, 95):>10.2f}{recall:>9.3f}")
+
+
+def benchmark_ear(n_faces, repeat=200):
+    """Per-face landmark list + calculate_EAR against landmarks_to_array + batch_EAR"""
+    import dlib
+    from Backend.FaceRecognition.FaceMain import (LEFT_EYE_IDX, RIGHT_EYE_IDX, batch_EAR, calculate_EAR,
+                                                  landmarks_to_array)
+
+    rng = np.random.default_rng(0)
+    shapes = []
+    for _ in range(n_faces):
+        points = rng.integers(100, 300, (68, 2))
+        shapes.append(dlib.full_object_detection(dlib.rectangle(100, 100, 300, 300),
+                                                 dlib.points([dlib.point(int(x), int(y)) for x, y in points])))
+
+    def current():
+        ears = []
+        for landmarks in shapes:
+            landmarks_points = np.array([[p.x, p.y] for p in landmarks.parts()])
+            left_ear = calculate_EAR(landmarks_points[LEFT_EYE_IDX])
+            right_ear = calculate_EAR(landmarks_points[RIGHT_EYE_IDX])
+            ears.append((left_ear + right_ear) / 2.0)
+        return np.array(ears)
+
+    def batched():
+        return batch_EAR([landmarks_to_array(landmarks) for landmarks in shapes])
+
+    assert np.allclose(current(), batched())
+    print(f"{n_faces} faces, {repeat} frames")
+    for name, fn in (("current", current), ("batched", batched)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        per_frame = (time.perf_counter() - start) / repeat * 1000
+        print(f"{name:<12}{per_frame:>8.3f} ms/frame{per_frame * 1000 / n_faces:>10.1f} us/face")
+
+
+def synthetic_school(conn, n_students, n_days, n_classes=30, presence=0.9, seed=0):
+    """Students spread over classes and n_days of attendance, returns (classes, dates)"""
+    from datetime import date, timedelta
+
+    rng = np.random.default_rng(seed)
+    classes = [f"{grade}{section}" for grade in range(1, 11) for section in "ABC"][:n_classes]
+    class_of = [classes[i % len(classes)] for i in range(n_students)]
+    conn.executemany("""
+        INSERT INTO Students (StudentID, Name, RollNumber, Class, Gender, Teacher, Password)
+        VALUES (?, ?, ?, ?, 'F', 'Teacher', 'x')
+    """, [(i + 1, f"Student {i + 1}", i // len(classes) + 1, class_of[i]) for i in range(n_students)])
+
+    start = date.today() - timedelta(days=n_days)
+    dates = [str(start + timedelta(days=d)) for d in range(n_days)]
+    conn.executemany("INSERT INTO SchoolDays (Date) VALUES (?)", [(d,) for d in dates])
+    for day in dates:
+        present = np.flatnonzero(rng.random(n_students) < presence)
+        conn.executemany("INSERT INTO Attendance (StudentID, Date, Status, Class) VALUES (?, ?, 'Present', ?)",
+                         [(int(i) + 1, day, class_of[i]) for i in present])
+    conn.commit()
+    return classes, dates
+
+
+def benchmark_attendance_db(n_students, n_days, repeat=200):
+    """Hot attendance queries of app.py and FaceMain before and after the schema migrations"""
+    from Backend.Database.Migrations import migrate
+    from Backend.Database.NewDataFile import create_db
+
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "school.db")
+        create_db(database, upgrade=False)
+        conn = sqlite3.connect(database)
+        start = time.perf_counter()
+        classes, dates = synthetic_school(conn, n_students, n_days)
+        rows = conn.execute("SELECT COUNT(*) FROM Attendance").fetchone()[0]
+        print(f"{n_students} students, {n_days} days, {rows} attendance rows "
+              f"(built in {time.perf_counter() - start:.1f} s)")
+
+        today = dates[-1]
+        student = lambda: (int(rng.integers(1, n_students + 1)),)
+        school_class = lambda: (classes[rng.integers(len(classes))],)
+        # name: (sql, parameters, runs), the whole-class and whole-day queries run less often
+        queries = {
+            "duplicate check": ("SELECT 1 FROM Attendance WHERE StudentID = ? AND Date = ?",
+                                lambda: student() + (today,), repeat),
+            "present days": ("SELECT COUNT(Date) FROM Attendance WHERE StudentID = ? AND Status = 'Present'",
+                             student, repeat),
+            "present today": ("SELECT COUNT(*) FROM Attendance WHERE Date = ? AND Status = 'Present'",
+                              lambda: (today,), max(repeat // 10, 1)),
+            "class today": ("""SELECT COUNT(*) FROM Attendance a JOIN Students s ON a.StudentID = s.StudentID
+                               WHERE s.Class = ? AND a.Date = ? AND a.Status = 'Present'""",
+                            lambda: school_class() + (today,), max(repeat // 10, 1)),
+            "class students": ("""SELECT s.StudentID, COUNT(CASE WHEN a.Status = 'Present' THEN 1 END)
+                                  FROM Students s LEFT JOIN Attendance a ON s.StudentID = a.StudentID
+                                  WHERE s.Class = ? GROUP BY s.StudentID""",
+                               school_class, max(repeat // 10, 1)),
+        }
+
+        def run_queries():
+            timings = {}
+            for name, (sql, params, runs) in queries.items():
+                begin = time.perf_counter()
+                for _ in range(runs):
+                    conn.execute(sql, params()).fetchall()
+                timings[name] = (time.perf_counter() - begin) / runs * 1000
+            return timings
+
+        before = run_queries()
+        start = time.perf_counter()
+        migrate(conn)
+        print(f"migrations: {time.perf_counter() - start:.2f} s")
+        after = run_queries()
+        conn.close()
+
+    print(f"{'query':<18}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in queries:
+        print(f"{name:<18}{before[name]:>12.3f}{after[name]:>12.3f}{before[name] / after[name]:>9.0f}x")
+
+
+def read_expected_ids(ids, labels_path):
+    """Student ids present in the clip, from --expected and/or a labels file (one id per line)"""
+    expected = [int(i) for i in ids.split(",") if i.strip()] if ids else []
+    if labels_path:
+        with open(labels_path) as f:
+            expected += [int(line) for line in f if line.strip()]
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face recognition benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gallery = commands.add_parser("gallery", help="ANN recall vs latency against the exact scan")
+    gallery.add_argument("--size", type=int, default=20000)
+    gallery.add_argument("--queries", type=int, default=500)
+
+    db_write = commands.add_parser("db-write", help="per-row vs bulk face_encodings writes")
+    db_write.add_argument("--rows", type=int, default=2000)
+
+    replay = commands.add_parser("replay", help="run a recorded clip through the attendance pipeline headless")
+    replay.add_argument("source", help="video file, rtsp:// URL, image folder, camera index or synthetic[:frames]")
+    replay.add_argument("--expected", help="comma separated student ids that appear in the clip")
+    replay.add_argument("--labels", help="file with one expected student id per line")
+    replay.add_argument("--student-class", help="recognize this class first, like the teacher view")
+    replay.add_argument("--fast", action="store_true",
+                        help="read frames as fast as possible instead of at the clip's frame rate")
+
+    detect_scale = commands.add_parser("detect-scale", help="HOG detection FPS and recall against detection scale")
+    detect_scale.add_argument("source", help="video file, image folder or synthetic[:frames]")
+    detect_scale.add_argument("--scales", default="1,0.75,0.5,0.35", help="comma separated scale factors")
+    detect_scale.add_argument("--frames", type=int, default=200, help="frames to read from the source")
+
+    ear = commands.add_parser("ear", help="landmark conversion and EAR, per face vs batched")
+    ear.add_argument("--faces", type=int, default=30)
+    ear.add_argument("--repeat", type=int, default=200)
+
+    attendance_db = commands.add_parser("attendance-db", help="attendance queries before and after the migrations")
+    attendance_db.add_argument("--students", type=int, default=3000)
+    attendance_db.add_argument("--days", type=int, default=220)
+    attendance_db.add_argument("--repeat", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == "gallery":
+        benchmark_gallery(args.size, args.queries)
+    elif args.command == "db-write":
+        benchmark_db_write(args.rows)
+    elif args.command == "replay":
+        benchmark_replay(args.source, read_expected_ids(args.expected, args.labels),
+                         args.student_class, realtime=not args.fast)
+    elif args.command == "detect-scale":
+        benchmark_detection_scale(args.source, [float(s) for s in args.scales.split(",")], args.frames)
+    elif args.command == "ear":
+        benchmark_ear(args.faces, args.repeat)
+    elif args.command == "attendance-db":
+        benchmark_attendance_db(args.students, args.days, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
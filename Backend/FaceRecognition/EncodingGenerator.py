@@ -1,9 +1,18 @@
+import argparse
 import cv2
 import face_recognition
-import pickle
+import hashlib
+import json
 import os
-import sqlite3
+import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from Backend.Database.DataAccess import connection
+from Backend.Database.Migrations import GALLERY_CHANGE_LOG_VERSION, schema_version
+from Backend.FaceRecognition.EncodingStore import (STORAGE_DTYPE, decode_gallery_rows, encode_blob, read_gallery_file,
+                                                   write_gallery_file)
+from Backend.FaceRecognition.GalleryCache import changed_since, database_identity, fetch_gallery_rows, latest_seq
 
 # Step 1: Get the directory where this script is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,29 +25,84 @@ db_path = os.path.join(PARENT_DIR, "Database", "school_portal.db")
 
 print("Using database path:", db_path)
 
-# Importing student images
 folderPath = os.path.join(BASE_DIR, "Images")
-pathList = os.listdir(folderPath)
-print("Images found:", pathList)
 
-imgList = []
-studentIds = []
+# Remembers the content hash + mtime of every image that was already encoded
+MANIFEST_PATH = os.path.join(BASE_DIR, "encoding_manifest.json")
+GALLERY_FILE = os.path.join(BASE_DIR, "gallery.fgal")
+# Change log position the gallery file reflects, see update_gallery_file
+GALLERY_STATE_PATH = os.path.join(BASE_DIR, "gallery.fgal.json")
 
-# Load images and extract student IDs
-for path in pathList:
-    img = cv2.imread(os.path.join(folderPath, path))
-    if img is not None:
-        imgList.append(img)
-        # Use filename without extension as student ID
-        studentIds.append(os.path.splitext(path)[0])
-    else:
-        print(f"Image {path} could not be loaded.")
+# Bulk enrollment settings (override with --workers / --chunksize)
+ENCODING_WORKERS = 1
+ENCODING_CHUNKSIZE = 8
+
+
+def file_sha1(path):
+    """Content hash of an image file"""
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest: {e}")
+        return {}
+
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
 
-print("Student IDs:", studentIds)
+
+def scan_images(manifest, encoded_ids):
+    """Compare the Images folder with the manifest.
+
+    Returns (changed, deleted): {file name: sha1} for images that are new or
+    whose content changed, and manifest entries whose image is gone. The hash
+    is only computed when size or mtime differ from the manifest.
+    """
+    changed = {}
+    current = set()
+
+    for path in sorted(os.listdir(folderPath)):
+        full_path = os.path.join(folderPath, path)
+        if not os.path.isfile(full_path):
+            continue
+        current.add(path)
+        stat = os.stat(full_path)
+        entry = manifest.get(path)
+
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            # Encoded earlier but missing from the DB (e.g. DB was recreated)
+            if entry["encoded"] and entry["student_id"] not in encoded_ids:
+                changed[path] = entry["sha1"]
+            continue
+
+        sha1 = file_sha1(full_path)
+        if entry and entry["sha1"] == sha1 and (not entry["encoded"] or entry["student_id"] in encoded_ids):
+            # Touched but not modified, just refresh the stat info
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            continue
+        changed[path] = sha1
+
+    deleted = [path for path in manifest if path not in current]
+    return changed, deleted
 
 
 # Function to find encodings
 def findEncodings(imagesList):
+    """Encode every image, returns a list aligned with imagesList (None where no face was found)"""
     encodeList = []
     for img in imagesList:
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
@@ -48,6 +112,7 @@ def findEncodings(imagesList):
 
         if len(faceLoc) == 0:
             print("No faces found in this image.")
+            encodeList.append(None)
             continue
 
         encode = face_recognition.face_encodings(img_rgb, faceLoc)
@@ -56,39 +121,234 @@ def findEncodings(imagesList):
             encodeList.append(encode[0])
         else:
             print("No face encoding found for this image.")
+            encodeList.append(None)
 
     return encodeList
 
 
-print("Encoding Started ...")
-encodeListKnown = findEncodings(imgList)
+def _encode_image_file(path):
+    """Load and encode one image file (runs inside pool workers).
 
-if len(encodeListKnown) == 0:
-    print("No valid encodings found. Exiting...")
-else:
-    print("Encoding Complete")
+    Returns (path, encoding, error). encoding is None with no error when the
+    image has no face; any exception is caught so one bad image cannot take
+    down the batch.
+    """
+    try:
+        img = cv2.imread(path)
+        if img is None:
+            return path, None, "could not be loaded"
+        return path, findEncodings([img])[0], None
+    except Exception as e:
+        return path, None, str(e)
 
-    # Save encodings to a file (backup)
-    with open("EncodeFile.p", 'wb') as file:
-        pickle.dump([encodeListKnown, studentIds], file)
-    print("File Saved (EncodeFile.p)")
 
-    # Save encodings to DB
-    def save_encoding_to_db(student_id, encoding):
-        """Save face encoding for a student into DB"""
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+def encode_images(paths, workers=ENCODING_WORKERS, chunksize=ENCODING_CHUNKSIZE):
+    """Encode image files, yielding (path, encoding, error) in input order.
+
+    With workers > 1 the images are spread over a process pool in chunks of
+    `chunksize`. Progress is printed about every 5%.
+    """
+    total = len(paths)
+    report_every = max(1, total // 20)
+    start = time.perf_counter()
+
+    def progress(done):
+        if done % report_every == 0 or done == total:
+            rate = done / max(time.perf_counter() - start, 1e-9)
+            print(f"Encoded {done}/{total} images ({rate:.1f} images/s)")
+
+    if workers <= 1:
+        for done, path in enumerate(paths, 1):
+            yield _encode_image_file(path)
+            progress(done)
+        return
+
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(_encode_image_file, paths, chunksize=chunksize):
+                done += 1
+                yield result
+                progress(done)
+    except BrokenProcessPool:
+        # A worker died (e.g. crashed inside dlib); report the rest as failed,
+        # they are not recorded in the manifest so the next run retries them
+        print(f"Encoding pool crashed after {done} images")
+        for path in paths[done:]:
+            yield path, None, "worker crashed"
+
+
+def bulk_upsert_encodings(items, delete_ids=(), database=db_path):
+    """Write many (student_id, encoding) pairs and deletions in one transaction.
+
+    Pooled connections use WAL journaling with synchronous=NORMAL (see
+    DataAccess), so the whole batch costs a single sync instead of one per
+    student. Returns rows written per second.
+    """
+    rows = [(student_id, encode_blob(encoding, STORAGE_DTYPE)) for student_id, encoding in items]
+    delete_rows = [(student_id,) for student_id in delete_ids]
+
+    start = time.perf_counter()
+    with connection(database) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO face_encodings (id, encoding) VALUES (?, ?)", rows)
+        conn.executemany("DELETE FROM face_encodings WHERE id = ?", delete_rows)
+    elapsed = time.perf_counter() - start
+
+    total = len(rows) + len(delete_rows)
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    print(f"Wrote {len(rows)} encodings, deleted {len(delete_rows)} in {elapsed * 1000:.1f} ms ({rate:.0f} rows/s)")
+    return rate
+
 
-        # Convert numpy array → bytes
-        encoding_bytes = encoding.astype(np.float64).tobytes()
+def save_encoding_to_db(student_id, encoding, database=db_path):
+    """Save face encoding for a student into DB (one transaction per row)"""
+    # Convert numpy array → compact bytes (see EncodingStore)
+    encoding_bytes = encode_blob(encoding, STORAGE_DTYPE)
 
+    with connection(database) as conn:
+        cursor = conn.cursor()
         cursor.execute("INSERT OR REPLACE INTO face_encodings (id, encoding) VALUES (?, ?)",
                        (student_id, encoding_bytes))
+        conn.commit()
+
+
+def load_encoded_ids():
+    with connection(db_path) as conn:
+        return {str(row[0]) for row in conn.execute("SELECT id FROM face_encodings")}
+
+
+def load_gallery_state():
+    """Change log position and database of the current gallery file, or None"""
+    try:
+        with open(GALLERY_STATE_PATH) as f:
+            state = json.load(f)
+        stat = os.stat(GALLERY_FILE)
+    except (OSError, ValueError):
+        return None
+    if state.get("size") != stat.st_size or state.get("mtime") != stat.st_mtime:
+        return None  # the file was replaced or written by an older version
+    return state
+
+
+def save_gallery_state(identity, watermark):
+    stat = os.stat(GALLERY_FILE)
+    tmp_path = GALLERY_STATE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"db_identity": identity, "watermark": watermark,
+                   "size": stat.st_size, "mtime": stat.st_mtime}, f)
+    os.replace(tmp_path, GALLERY_STATE_PATH)
 
+
+def update_gallery_file():
+    """Bring the binary gallery file (see EncodingStore) used to boot without SQLite up to date.
+
+    The file remembers the change log position it reflects (see
+    GalleryCache), so only ids logged since then are read again, including
+    students who changed class, and the file is not opened when nothing was
+    logged. A missing or unreadable file, another database or a log
+    compacted past that position means a full rebuild.
+    """
+    with connection(db_path) as conn:
+        cursor = conn.cursor()
+        # One read transaction so the watermark matches the rows we read
+        cursor.execute("BEGIN")
+        identity = latest = changed_ids = None
+        if schema_version(conn) >= GALLERY_CHANGE_LOG_VERSION:
+            identity, latest = database_identity(cursor), latest_seq(cursor)
+            state = load_gallery_state()
+            if state and state["db_identity"] == identity and state["watermark"] <= latest:
+                if state["watermark"] == latest:
+                    conn.commit()
+                    return
+                changed_ids = changed_since(cursor, state["watermark"])
+
+        gallery = None
+        if changed_ids is not None:
+            try:
+                gallery = read_gallery_file(GALLERY_FILE)
+            except (OSError, ValueError) as e:
+                print(f"Rebuilding unreadable {GALLERY_FILE}: {e}")
+        rows = fetch_gallery_rows(cursor, changed_ids if gallery is not None else None)
         conn.commit()
-        conn.close()
 
-    # Loop over each student and save encoding
-    for student_id, encoding in zip(studentIds, encodeListKnown):
-        save_encoding_to_db(student_id, encoding)
-        print(f"Saved encoding for {student_id} to DB")
\ No newline at end of file
+    encodings, studentIds, studentClasses = decode_gallery_rows(rows)
+    if gallery is not None:
+        # Drop every changed id, then append the rows that still exist
+        old_encodings, old_ids, old_classes = gallery
+        keep = ~np.isin(old_ids, np.asarray(changed_ids, dtype=np.int64))
+        encodings = np.concatenate([old_encodings[keep], encodings])
+        studentIds = np.concatenate([old_ids[keep], studentIds])
+        studentClasses = [c for c, k in zip(old_classes, keep) if k] + studentClasses
+
+    write_gallery_file(GALLERY_FILE, encodings, studentIds, studentClasses)
+    if identity is not None:
+        save_gallery_state(identity, latest)
+    if gallery is None:
+        print(f"File Saved ({GALLERY_FILE}), rebuilt with {len(studentIds)} encodings")
+    else:
+        print(f"File Saved ({GALLERY_FILE}), {len(changed_ids)} changed ids")
+
+
+def generate_encodings(workers=ENCODING_WORKERS, chunksize=ENCODING_CHUNKSIZE, sync_gallery_file=True):
+    """Encode new or changed student photos and prune deleted ones.
+
+    The gallery file is updated when encodings changed or it is missing.
+    sync_gallery_file=False (the gallery is served from the database) leaves
+    other changes, like a student moving class, for the next update.
+    """
+    if not os.path.isdir(folderPath):
+        print(f"Images folder not found: {folderPath}")
+        return
+
+    manifest = load_manifest()
+    changed, deleted = scan_images(manifest, load_encoded_ids())
+    print(f"Images changed: {len(changed)}, deleted: {len(deleted)}")
+
+    print("Encoding Started ...")
+    results = encode_images([os.path.join(folderPath, path) for path in changed], workers, chunksize)
+
+    new_encodings = {}
+    removed_ids = [manifest[path]["student_id"] for path in deleted]
+    for full_path, encoding, error in results:
+        path = os.path.basename(full_path)
+        if error:
+            print(f"Image {path} failed: {error}")
+            continue
+
+        # Use filename without extension as student ID
+        student_id = os.path.splitext(path)[0]
+        stat = os.stat(full_path)
+        manifest[path] = {
+            "student_id": student_id,
+            "sha1": changed[path],
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "encoded": encoding is not None,
+        }
+        if encoding is not None:
+            new_encodings[student_id] = encoding
+        else:
+            # The new photo has no usable face, drop the stale encoding
+            removed_ids.append(student_id)
+
+    for path in deleted:
+        del manifest[path]
+
+    # A photo may be replaced by one with another extension, keep the new encoding
+    removed_ids = [i for i in removed_ids if i not in new_encodings]
+    if new_encodings or removed_ids:
+        bulk_upsert_encodings(new_encodings.items(), removed_ids)
+    if sync_gallery_file or new_encodings or removed_ids or not os.path.exists(GALLERY_FILE):
+        update_gallery_file()
+    save_manifest(manifest)
+    print("Encoding Complete")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode student photos into face_encodings")
+    parser.add_argument("--workers", type=int, default=ENCODING_WORKERS,
+                        help="encoding processes, use os.cpu_count() for bulk enrollment")
+    parser.add_argument("--chunksize", type=int, default=ENCODING_CHUNKSIZE,
+                        help="images handed to a worker at a time")
+    args = parser.parse_args()
+    generate_encodings(args.workers, args.chunksize)
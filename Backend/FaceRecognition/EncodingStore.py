@@ -0,0 +1,253 @@
+"""Storage format for face_encodings blobs.
+
+A blob is one header byte giving the format, followed by the 128 values:
+
+    0x01  float32  (513 bytes)
+    0x02  float16  (257 bytes)
+
+Older rows written before the header existed are raw float64 (1024 bytes)
+or a pickled numpy array; they are still readable and can be rewritten
+with:
+
+    python -m Backend.FaceRecognition.EncodingStore migrate --dtype float32
+
+The whole gallery can also be written to a standalone gallery file (see
+write_gallery_file) so recognition can start without SQLite.
+"""
+import argparse
+import operator
+import os
+import pickle
+import sqlite3
+import struct
+import zlib
+
+import numpy as np
+
+from Backend.FaceRecognition.GalleryIndex import ENCODING_DIM
+
+FORMAT_FLOAT32 = 0x01
+FORMAT_FLOAT16 = 0x02
+FORMATS = {
+    "float32": (FORMAT_FLOAT32, np.dtype("<f4")),
+    "float16": (FORMAT_FLOAT16, np.dtype("<f2")),
+}
+
+# Format used for newly written encodings
+STORAGE_DTYPE = "float32"
+
+LEGACY_FLOAT64_SIZE = ENCODING_DIM * 8
+
+
+def encode_blob(encoding, dtype=STORAGE_DTYPE):
+    """Serialize one 128-d encoding into the compact blob format"""
+    header, np_dtype = FORMATS[dtype]
+    return bytes([header]) + np.asarray(encoding, dtype=np_dtype).tobytes()
+
+
+def _pick(blobs, indices):
+    """blobs[indices] for a list, without a Python-level loop"""
+    picked = operator.itemgetter(*indices)(blobs)
+    return picked if len(indices) > 1 else (picked,)
+
+
+def decode_blobs(blobs):
+    """Decode a list of blobs into one (n, 128) float32 matrix.
+
+    Rows are grouped by layout and each group is decoded with a single
+    frombuffer call. Returns (matrix, valid) where valid marks the rows that
+    held a usable encoding; invalid rows are zero in the matrix.
+    """
+    blobs = list(blobs)
+    matrix = np.zeros((len(blobs), ENCODING_DIM), dtype=np.float32)
+    valid = np.zeros(len(blobs), dtype=bool)
+    if not blobs:
+        return matrix, valid
+
+    lengths = np.fromiter(map(len, blobs), dtype=np.int64, count=len(blobs))
+
+    for header, np_dtype in FORMATS.values():
+        size = 1 + ENCODING_DIM * np_dtype.itemsize
+        indices = np.flatnonzero(lengths == size)
+        if len(indices) == 0:
+            continue
+        raw = np.frombuffer(b"".join(_pick(blobs, indices)), dtype=np.uint8).reshape(-1, size)
+        ok = raw[:, 0] == header
+        payload = np.ascontiguousarray(raw[ok, 1:]).view(np_dtype)
+        matrix[indices[ok]] = payload
+        valid[indices[ok]] = True
+
+    # Legacy raw float64 rows (no header byte)
+    indices = np.flatnonzero((lengths == LEGACY_FLOAT64_SIZE) & ~valid)
+    if len(indices):
+        raw = np.frombuffer(b"".join(_pick(blobs, indices)), dtype=np.float64)
+        matrix[indices] = raw.reshape(-1, ENCODING_DIM)
+        valid[indices] = True
+
+    # Anything else may be a pickled array from very old versions
+    for index in np.flatnonzero(~valid):
+        try:
+            encoding = pickle.loads(blobs[index])
+            if isinstance(encoding, np.ndarray) and encoding.shape == (ENCODING_DIM,):
+                matrix[index] = encoding
+                valid[index] = True
+        except Exception:
+            continue
+
+    return matrix, valid
+
+
+def decode_rows(rows):
+    """Turn (id, blob) rows into an (n, 128) float32 matrix and an id array"""
+    if not rows:
+        return np.zeros((0, ENCODING_DIM), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    student_ids, blobs = zip(*rows)
+    matrix, valid = decode_blobs(blobs)
+    return matrix[valid], np.asarray(student_ids, dtype=np.int64)[valid]
+
+
+def decode_gallery_rows(rows):
+    """(id, blob, class) rows into (float32 matrix, id array, class list), skipping unreadable blobs"""
+    if not rows:
+        return np.zeros((0, ENCODING_DIM), dtype=np.float32), np.zeros(0, dtype=np.int64), []
+    student_ids, blobs, student_classes = zip(*rows)
+    matrix, valid = decode_blobs(blobs)
+    return (matrix[valid], np.asarray(student_ids, dtype=np.int64)[valid],
+            [c for c, ok in zip(student_classes, valid) if ok])
+
+
+def migrate_encodings(database, dtype=STORAGE_DTYPE):
+    """Rewrite every face_encodings row in the given compact format"""
+    header = FORMATS[dtype][0]
+    conn = sqlite3.connect(database)
+    try:
+        rows = conn.execute("SELECT id, encoding FROM face_encodings").fetchall()
+        pending = [(student_id, blob) for student_id, blob in rows if not (blob and blob[0] == header
+                   and len(blob) == 1 + ENCODING_DIM * FORMATS[dtype][1].itemsize)]
+        matrix, student_ids = decode_rows(pending)
+
+        before = sum(len(blob) for _, blob in rows)
+        with conn:
+            conn.executemany("UPDATE face_encodings SET encoding = ? WHERE id = ?",
+                             [(encode_blob(encoding, dtype), int(student_id))
+                              for encoding, student_id in zip(matrix, student_ids)])
+        after = conn.execute("SELECT COALESCE(SUM(LENGTH(encoding)), 0) FROM face_encodings").fetchone()[0]
+    finally:
+        conn.close()
+
+    skipped = len(pending) - len(student_ids)
+    print(f"Migrated {len(student_ids)} of {len(rows)} encodings to {dtype} "
+          f"({before} -> {after} bytes), {skipped} unreadable rows left untouched")
+    return len(student_ids)
+
+
+# Gallery file layout (little endian):
+#   header     magic "FGAL", version u8, format u8, dim u16, count u32
+#   matrix     count x dim values in the blob format's dtype
+#   ids        count x int64
+#   classes    count x (u16 length + utf-8 bytes), length 0xFFFF means no class
+#   trailer    CRC32 (u32) of everything above
+GALLERY_FILE_MAGIC = b"FGAL"
+GALLERY_FILE_VERSION = 1
+GALLERY_HEADER = struct.Struct("<4sBBHI")
+NO_CLASS = 0xFFFF
+READ_CHUNK_ROWS = 4096
+
+
+def write_gallery_file(path, encodings, student_ids, student_classes, dtype=STORAGE_DTYPE):
+    """Write the gallery to a single checksummed binary file (atomically)"""
+    format_code, np_dtype = FORMATS[dtype]
+    encodings = np.asarray(encodings, dtype=np_dtype).reshape(-1, ENCODING_DIM)
+    student_ids = np.asarray(student_ids, dtype="<i8")
+
+    class_table = bytearray()
+    for student_class in student_classes:
+        if student_class is None:
+            class_table += struct.pack("<H", NO_CLASS)
+        else:
+            name = str(student_class).encode("utf-8")
+            class_table += struct.pack("<H", len(name)) + name
+
+    parts = [
+        GALLERY_HEADER.pack(GALLERY_FILE_MAGIC, GALLERY_FILE_VERSION, format_code,
+                            ENCODING_DIM, encodings.shape[0]),
+        encodings.tobytes(),
+        student_ids.tobytes(),
+        bytes(class_table),
+    ]
+    crc = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for part in parts:
+            crc = zlib.crc32(part, crc)
+            f.write(part)
+        f.write(struct.pack("<I", crc))
+    os.replace(tmp_path, path)
+
+
+def read_gallery_file(path, chunk_rows=READ_CHUNK_ROWS):
+    """Stream a gallery file into (float32 matrix, id array, class list).
+
+    The matrix is read chunk by chunk straight into its final buffer while
+    the checksum is updated, so peak memory stays at the gallery size.
+    Raises ValueError if the file is truncated, unknown or corrupt.
+    """
+    with open(path, "rb") as f:
+        header = f.read(GALLERY_HEADER.size)
+        if len(header) != GALLERY_HEADER.size:
+            raise ValueError("gallery file is truncated")
+        magic, version, format_code, dim, count = GALLERY_HEADER.unpack(header)
+        if magic != GALLERY_FILE_MAGIC or version != GALLERY_FILE_VERSION or dim != ENCODING_DIM:
+            raise ValueError("not a supported gallery file")
+        np_dtype = {code: dt for code, dt in FORMATS.values()}.get(format_code)
+        if np_dtype is None:
+            raise ValueError(f"unknown encoding format {format_code}")
+        crc = zlib.crc32(header)
+
+        def read_exact(buffer):
+            view = memoryview(buffer).cast("B")
+            if f.readinto(view) != len(view):
+                raise ValueError("gallery file is truncated")
+            return zlib.crc32(view, crc)
+
+        stored = np.empty((count, dim), dtype=np_dtype)
+        for start in range(0, count, chunk_rows):
+            crc = read_exact(stored[start:start + chunk_rows])
+
+        student_ids = np.empty(count, dtype="<i8")
+        crc = read_exact(student_ids)
+
+        student_classes = []
+        for _ in range(count):
+            length_bytes = f.read(2)
+            if len(length_bytes) != 2:
+                raise ValueError("gallery file is truncated")
+            crc = zlib.crc32(length_bytes, crc)
+            (length,) = struct.unpack("<H", length_bytes)
+            if length == NO_CLASS:
+                student_classes.append(None)
+                continue
+            name = f.read(length)
+            crc = zlib.crc32(name, crc)
+            student_classes.append(name.decode("utf-8"))
+
+        trailer = f.read(4)
+        if len(trailer) != 4 or struct.unpack("<I", trailer)[0] != crc:
+            raise ValueError("gallery file checksum mismatch")
+
+    matrix = stored if stored.dtype == np.float32 else stored.astype(np.float32)
+    return matrix, student_ids, student_classes
+
+
+if __name__ == "__main__":
+    default_db = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "Database", "school_portal.db")
+    parser = argparse.ArgumentParser(description="face_encodings storage tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="rewrite existing rows in the compact format")
+    migrate.add_argument("--dtype", choices=sorted(FORMATS), default=STORAGE_DTYPE)
+    migrate.add_argument("--db", default=default_db)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_encodings(args.db, args.dtype)
@@ -1,13 +1,24 @@
 import os
-import pickle
+import queue
+import threading
+import time
 import numpy as np
 import cv2
 import dlib
-import face_recognition
-from collections import deque
-import sqlite3
-from datetime import datetime, date
-from scipy.spatial import distance as dist
+import face_recognition_models
+from datetime import date
+from Backend.FaceRecognition.GalleryIndex import ClassPartitionedGallery
+from Backend.FaceRecognition.GalleryCache import GalleryCache
+from Backend.FaceRecognition.EncodingStore import read_gallery_file
+from Backend.FaceRecognition.EncodingGenerator import GALLERY_FILE, generate_encodings
+from Backend.FaceRecognition.Pipeline import DropOldestQueue, StageStats, start_worker
+from Backend.FaceRecognition.FrameSource import WebcamSource
+from Backend.FaceRecognition.Tracking import REDETECT_EVERY, FaceTracker
+from Backend.FaceRecognition.Liveness import LivenessRegistry
+from Backend.FaceRecognition.IdentityCache import IdentityCache
+from Backend.FaceRecognition.Voting import PENDING, TrackVoter
+from Backend.FaceRecognition.AttendanceWriter import AttendanceWriter
+from Backend.Database.DataAccess import connection, upgrade_schema
 
 # Step 1: Get the directory where this script is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -20,81 +31,90 @@ db_path = os.path.join(PARENT_DIR, "Database", "school_portal.db")
 
 print("Using database path:", db_path)
 
+# Memory-mapped, incrementally refreshed snapshot of face_encodings (shared by all workers)
+GALLERY_SNAPSHOT_DIR = os.path.join(BASE_DIR, "gallery_snapshot")
+
 
 # Performance optimization: Precompute constants
 LEFT_EYE_IDX = list(range(36, 42))  # Convert to list for faster access
 RIGHT_EYE_IDX = list(range(42, 48))
+# Only the 12 eye points are read from dlib for the blink check
+EYE_IDX = LEFT_EYE_IDX + RIGHT_EYE_IDX
+# EAR pairs within one eye: (p1, p5), (p2, p4), (p0, p3)
+EAR_FROM = [1, 2, 0]
+EAR_TO = [5, 4, 3]
 
 def mark_school_day():
     """Ensure today's date exists in SchoolDays (means school is open)."""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    today = str(date.today())
-
-    cursor.execute("SELECT 1 FROM SchoolDays WHERE Date = ?", (today,))
-    if cursor.fetchone() is None:
-        cursor.execute("INSERT INTO SchoolDays (Date) VALUES (?)", (today,))
-        conn.commit()
-        print(f"School open day added: {today}")
-    conn.close()
-
-
-def mark_attendance(student_id):
-    """Mark student's attendance for today."""
-    try:
-        connection = sqlite3.connect(db_path)
-        cursor = connection.cursor()
-
+    with connection(db_path) as conn:
+        cursor = conn.cursor()
         today = str(date.today())
 
-        # Fetch student's class
-        cursor.execute("""
-            SELECT Class FROM Students
-            WHERE StudentID = ?
-        """, (student_id,))
-        result = cursor.fetchone()
-        if not result:
-            print(f"No student found with ID {student_id}")
-            return
-        student_class = result[0]
-
-        # Ensure school day is added
-        mark_school_day()
+        cursor.execute("SELECT 1 FROM SchoolDays WHERE Date = ?", (today,))
+        if cursor.fetchone() is None:
+            cursor.execute("INSERT INTO SchoolDays (Date) VALUES (?)", (today,))
+            conn.commit()
+            print(f"School open day added: {today}")
+
+
+def write_attendance_batch(student_ids, day=None):
+    """Mark attendance on `day` (default today) for many students in one transaction.
+
+    Students already marked that day or not in Students are skipped. Returns
+    the ids that were newly marked; database errors are raised.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return []
+    today = str(day or date.today())
+    placeholders = ",".join("?" * len(student_ids))
+
+    with connection(db_path) as conn, conn:
+        cursor = conn.cursor()
+        # Write lock up front, so nobody marks these students between the check and the insert
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"SELECT StudentID, Class FROM Students WHERE StudentID IN ({placeholders})",
+                       student_ids)
+        class_of = dict(cursor.fetchall())
+        cursor.execute(f"SELECT StudentID FROM Attendance WHERE Date = ? AND StudentID IN ({placeholders})",
+                       [today] + student_ids)
+        marked = {row[0] for row in cursor.fetchall()}
+
+        new_ids = [i for i in student_ids if i in class_of and i not in marked]
+        already = [i for i in student_ids if i in marked]
+        if new_ids:
+            # Ensure school day is added
+            cursor.execute("INSERT OR IGNORE INTO SchoolDays (Date) VALUES (?)", (today,))
+            # The unique (StudentID, Date) index still guards against duplicates
+            cursor.executemany("""
+                INSERT OR IGNORE INTO Attendance (StudentID, Date, Status, Class)
+                VALUES (?, ?, 'Present', ?)
+            """, [(i, today, class_of[i]) for i in new_ids])
 
-        # Check if attendance already exists
-        cursor.execute("""
-            SELECT 1 FROM Attendance
-            WHERE StudentID = ? AND Date = ?
-        """, (student_id, today))
-        row = cursor.fetchone()
+    for i in student_ids:
+        if i not in class_of:
+            print(f"No student found with ID {i}")
+    if new_ids:
+        print(f"Attendance marked for IDs: {new_ids} on {today}")
+    if already:
+        print(f"Attendance already marked for students {already} on {today}")
+    return new_ids
 
-        if row:
-            print(f"Attendance already marked for student {student_id} on {today}")
-        else:
-            # Insert new attendance record
-            cursor.execute("""
-                INSERT INTO Attendance (StudentID, Date, Status, Class)
-                VALUES (?, ?, 'Present', ?)
-            """, (student_id, today, student_class))
-            connection.commit()
-            print(f"Attendance marked for ID: {student_id} on {today}")
 
-    except Exception as e:
-        print(f"Error updating attendance: {e}")
+def load_marked_students(day=None):
+    """Ids of the students already marked present on `day` (default today)"""
+    with connection(db_path) as conn:
+        rows = conn.execute("SELECT StudentID FROM Attendance WHERE Date = ?",
+                            (str(day or date.today()),)).fetchall()
+    return [row[0] for row in rows]
 
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
 
 def get_student_details(student_id):
     """Fetch student id and name from users table."""
     try:
-        connection = sqlite3.connect(db_path)
-        cursor = connection.cursor()
-
-        cursor.execute("SELECT StudentID, Name FROM Students WHERE StudentID = ?", (student_id,))
-        row = cursor.fetchone()
+        with connection(db_path) as conn:
+            row = conn.execute("SELECT StudentID, Name FROM Students WHERE StudentID = ?",
+                               (student_id,)).fetchone()
         if row:
             return {"id": row[0], "name": row[1]}
         return None
@@ -103,10 +123,21 @@ def get_student_details(student_id):
         print(f"Database Error: {e}")
         return None
 
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+
+def get_students_details(student_ids):
+    """{id: {"id", "name"}} for the given students, in one query"""
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return {}
+    placeholders = ",".join("?" * len(student_ids))
+    try:
+        with connection(db_path) as conn:
+            rows = conn.execute(f"SELECT StudentID, Name FROM Students WHERE StudentID IN ({placeholders})",
+                                student_ids).fetchall()
+    except Exception as e:
+        print(f"Database Error: {e}")
+        return {}
+    return {row[0]: {"id": row[0], "name": row[1]} for row in rows}
 
 
 # Constants (Optimized values)
@@ -116,36 +147,77 @@ FRAME_BUFFER_SIZE = 3  # Reduced buffer size for faster response
 MIN_EAR_CHANGE = 0.07  # Smaller change required
 STABILITY_THRESHOLD = 25  # Slightly higher for better stability
 
+# Gallery lookup backend: "exact" scan or approximate "ivf" for district-scale galleries
+GALLERY_BACKEND = os.environ.get("FACE_GALLERY_BACKEND", "exact")
 
-def load_encodings_from_db():
-    """Load all encodings + IDs from DB"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+# Where the gallery comes from: "db" (face_encodings via the snapshot cache)
+# or "file" (the binary gallery file, no SQLite needed)
+GALLERY_SOURCE = os.environ.get("FACE_GALLERY_SOURCE", "db")
 
-    cursor.execute("SELECT id, encoding FROM face_encodings")
-    rows = cursor.fetchall()
+# Pipeline sizing: recognition threads and queue depths (older items are dropped)
+RECOGNITION_WORKERS = 2
+FRAME_QUEUE_SIZE = 2
+RECOGNITION_QUEUE_SIZE = 4
 
-    encode_list_known = []
-    student_ids = []
+# Detection-then-tracking: full HOG detection every Tracking.REDETECT_EVERY
+# frames, correlation trackers in between (FACE_TRACKING=0 detects every frame)
+FACE_TRACKING = os.environ.get("FACE_TRACKING", "1") == "1"
 
-    for student_id, encoding_bytes in rows:
-        try:
-            encoding = np.frombuffer(encoding_bytes, dtype=np.float64)
-            if encoding.shape[0] == 128:
-                encode_list_known.append(encoding)
-                student_ids.append(student_id)
-        except:
-            try:
-                encoding = pickle.loads(encoding_bytes)
-                if isinstance(encoding, np.ndarray) and encoding.shape[0] == 128:
-                    encode_list_known.append(encoding)
-                    student_ids.append(student_id)
-            except:
-                continue
+# HOG detection runs on the frame scaled by this factor and the boxes are
+# mapped back to full resolution. HOG needs faces of about 80 px, so 0.5 only
+# finds faces larger than ~160 px in the 640x480 frame; pick a value with
+# `Benchmark detect-scale` on a clip from the actual camera position.
+DETECTION_SCALE = float(os.environ.get("FACE_DETECTION_SCALE", "1.0"))
+
+# Classroom mode: every live face in a frame is encoded and matched in one
+# batch and marked together, instead of one student at a time (FACE_CLASSROOM=1)
+CLASSROOM_MODE = os.environ.get("FACE_CLASSROOM") == "1"
+
+# Decide on a track's identity from several frames with a best vs second-best
+# margin and early exit (see Voting); FACE_VOTING=0 accepts the first match
+RECOGNITION_VOTING = os.environ.get("FACE_VOTING", "1") == "1"
+
+# Headless mode (no window, no ESC key) for servers and benchmarks, FACE_HEADLESS=1
+HEADLESS = os.environ.get("FACE_HEADLESS") == "1"
+
+
+gallery_cache = GalleryCache(db_path, GALLERY_SNAPSHOT_DIR)
+_gallery = None
+_gallery_file_mtime = None
 
-    conn.close()
-    print(f"Loaded {len(encode_list_known)} encodings")
-    return encode_list_known, student_ids
+
+def load_gallery_from_file(path=GALLERY_FILE):
+    """Build the gallery straight from the binary gallery file"""
+    encodings, student_ids, student_classes = read_gallery_file(path)
+    print(f"Loaded {len(student_ids)} encodings from {path}")
+    return ClassPartitionedGallery(encodings, student_ids, student_classes, backend=GALLERY_BACKEND)
+
+
+def load_gallery(export=True):
+    """Return the recognition gallery, rebuilding it only when face_encodings changed.
+
+    export=False leaves the database and the snapshot directory untouched.
+    """
+    global _gallery, _gallery_file_mtime
+    if GALLERY_SOURCE == "file":
+        try:
+            mtime = os.path.getmtime(GALLERY_FILE)
+            if _gallery is None or mtime != _gallery_file_mtime:
+                _gallery = load_gallery_from_file()
+                _gallery_file_mtime = mtime
+            return _gallery
+        except (OSError, ValueError) as e:
+            print(f"Cannot use gallery file {GALLERY_FILE} ({e}), loading the gallery from the database. "
+                  "Run python -m Backend.FaceRecognition.EncodingGenerator to write it again.")
+            _gallery, _gallery_file_mtime = None, None
+
+    changed = gallery_cache.refresh(export=export)
+    if changed or _gallery is None:
+        _gallery = ClassPartitionedGallery(gallery_cache.encodings, gallery_cache.student_ids,
+                                           gallery_cache.student_classes, backend=GALLERY_BACKEND,
+                                           norms=gallery_cache.norms, class_ranges=gallery_cache.class_ranges)
+        print(f"Gallery ready with {len(_gallery)} encodings")
+    return _gallery
 
 
 def initialize_dlib():
@@ -174,14 +246,25 @@ def calculate_EAR(eye):
     return (A + B) / (2.0 * C)
 
 
+def landmarks_to_array(landmarks, indices=EYE_IDX):
+    """(len(indices), 2) array of the given landmark points (the eyes by default)"""
+    return np.array([(landmarks.part(i).x, landmarks.part(i).y) for i in indices], dtype=np.float64)
+
+
+def batch_EAR(eyes):
+    """Average EAR of both eyes for N faces in one expression.
+
+    eyes is (N, 12, 2): the left then right eye points per face, as returned
+    by landmarks_to_array. Returns an (N,) array.
+    """
+    eyes = np.asarray(eyes, dtype=np.float64).reshape(-1, 2, 6, 2)
+    d = np.sqrt(((eyes[:, :, EAR_FROM] - eyes[:, :, EAR_TO]) ** 2).sum(axis=-1))
+    return ((d[..., 0] + d[..., 1]) / (2.0 * d[..., 2])).mean(axis=1)
+
+
 def initialize_camera(width=640, height=480):
     """Initialize camera with optimized settings"""
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-    cap.set(cv2.CAP_PROP_FPS, 30)  # Set to 30 FPS
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce buffer size
-    return cap
+    return WebcamSource(0, width, height)
 
 
 def is_face_stable(face, face_position_buffer):
@@ -222,8 +305,31 @@ def enhanced_blink_detection(avg_ear, blink_counter, consecutive_blinks, ear_buf
     return blink_counter, consecutive_blinks
 
 
-def process_face_recognition(frame, face, encode_list_known, student_ids):
-    """Optimized face recognition"""
+_thread_models = threading.local()
+
+
+def get_face_encoder():
+    """dlib's ResNet encoder is not safe to share between threads, so each
+    recognition worker loads its own copy on first use"""
+    if not hasattr(_thread_models, "encoder"):
+        _thread_models.pose_predictor = dlib.shape_predictor(
+            face_recognition_models.pose_predictor_five_point_model_location())
+        _thread_models.encoder = dlib.face_recognition_model_v1(
+            face_recognition_models.face_recognition_model_location())
+    return _thread_models.pose_predictor, _thread_models.encoder
+
+
+def encode_faces(rgb_image, rects):
+    """128-d encodings for the given dlib rectangles of one RGB image"""
+    pose_predictor, encoder = get_face_encoder()
+    shapes = dlib.full_object_detections()
+    for rect in rects:
+        shapes.append(pose_predictor(rgb_image, rect))
+    return [np.array(descriptor) for descriptor in encoder.compute_face_descriptor(rgb_image, shapes, 1)]
+
+
+def encode_face_crop(frame, face):
+    """Encoding of one face from a padded, half-size crop (None if there is none)"""
     # Extract face region with padding
     padding = 20
     y1 = max(0, face.top() - padding)
@@ -240,97 +346,302 @@ def process_face_recognition(frame, face, encode_list_known, student_ids):
     small_face = cv2.resize(face_img, (0, 0), fx=0.5, fy=0.5)
     face_img_rgb = cv2.cvtColor(small_face, cv2.COLOR_BGR2RGB)
 
-    encode_cur_frame = face_recognition.face_encodings(face_img_rgb)
+    # The face box is already known, no need to detect it again inside the crop
+    scale = small_face.shape[1] / face_img.shape[1]
+    face_rect = dlib.rectangle(int((face.left() - x1) * scale), int((face.top() - y1) * scale),
+                               int((face.right() - x1) * scale), int((face.bottom() - y1) * scale))
+    encode_cur_frame = encode_faces(face_img_rgb, [face_rect])
+    return encode_cur_frame[0] if encode_cur_frame else None
+
 
-    if encode_cur_frame:
-        encode_face = encode_cur_frame[0]
-        # Use faster comparison with tolerance
-        matches = face_recognition.compare_faces(encode_list_known, encode_face, tolerance=0.5)
-        face_dis = face_recognition.face_distance(encode_list_known, encode_face)
+def process_face_recognition(frame, face, gallery, student_class=None):
+    """Optimized face recognition, returns (student, distance) or (None, None)"""
+    encode_face = encode_face_crop(frame, face)
 
-        if True in matches:
-            match_index = np.argmin(face_dis)
-            student_id = student_ids[match_index]
+    if encode_face is not None:
+        # Single vectorized lookup with the tolerance check folded in
+        match = gallery.best_match(encode_face, student_class=student_class)
+
+        if match:
+            student_id, distance = match
             student = get_student_details(student_id)
             if student:
                 print(f"Recognized: {student['name']}")
-                return student
-    return None
+                return student, distance
+    return None, None
 
 
-def run_face_attendance():
-    """Main function with performance optimizations"""
-    with open(os.path.join(BASE_DIR, "EncodingGenerator.py")) as f:
-        exec(f.read())
-    encode_list_known, student_ids = load_encodings_from_db()
-    detector, predictor = initialize_dlib()
-    cap = initialize_camera()
+def students_for_matches(matches):
+    """Replace student ids by student details in (student_id, distance) pairs.
 
-    blink_counter = 0
-    consecutive_blinks = 0
-    process_live_face = False
-    ear_buffer = deque(maxlen=FRAME_BUFFER_SIZE)
-    face_position_buffer = deque(maxlen=2)  # Smaller buffer for speed
-    attendance_marked = False  # Flag to track if attendance was marked
+    Unknown ids become (None, None); None entries (undecided) are kept.
+    """
+    details = get_students_details([m[0] for m in matches if m is not None and m[0] is not None])
+    results = []
+    for match in matches:
+        if match is None:
+            results.append(None)
+            continue
+        student = details.get(match[0])
+        if student:
+            print(f"Recognized: {student['name']}")
+        results.append((student, match[1]) if student else (None, None))
+    return results
+
+
+def recognize_faces(frame, faces, gallery, student_class=None):
+    """Recognize several faces of one frame at once.
+
+    All boxes go through a single encoder call and a single vectorized
+    gallery query. Returns (student, distance) per face, (None, None) for
+    faces that matched nobody.
+    """
+    if not faces:
+        return []
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    encodings = encode_faces(rgb_frame, faces)
+    if not encodings:
+        return [(None, None)] * len(faces)
+
+    matches = gallery.query_batch(np.asarray(encodings), k=1, student_class=student_class)
+    return students_for_matches([match[0] if match else (None, None) for match in matches])
+
+
+def vote_on_faces(frame, faces, voter, batch=False):
+    """Add this frame's encoding of every (track_id, rect) face to its track's votes (see Voting).
+
+    Faces are encoded from crops, or all at once from the full frame with
+    batch=True. Returns per face (student, distance) once decided, (None,
+    None) for a rejected face and None while more frames are needed.
+    """
+    if batch:
+        encodings = encode_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), [rect for _, rect in faces])
+    else:
+        encodings = [encode_face_crop(frame, rect) for _, rect in faces]
 
-    # Performance monitoring
-    frame_count = 0
-    start_time = datetime.now()
+    decisions = []
+    for (track_id, _), encoding in zip(faces, encodings):
+        if encoding is None:
+            decisions.append(None)
+            continue
+        status, student_id, distance = voter.add(track_id, encoding)
+        decisions.append(None if status == PENDING else (student_id, distance))
+    return students_for_matches(decisions)
+
+
+def run_face_attendance(student_class=None, source=None, headless=None, stats=None,
+                        on_recognized=None, record_attendance=True, classroom=None):
+    """Main function with performance optimizations
+
+    student_class limits recognition to that class's students first and only
+    falls back to the whole school when nobody in the class matches.
+
+    source is any FrameSource (webcam by default). With headless=True no
+    window is opened and the run ends when the source runs out of frames.
+    Benchmarks pass their own StageStats, an on_recognized(student) callback
+    and record_attendance=False so nothing is written to the database or the
+    gallery snapshot (the encodings are not regenerated either, the stored
+    gallery is used as is).
+
+    In classroom mode all live faces of a frame are recognized as one batch
+    (see recognize_faces) and the run keeps going until the source ends or
+    ESC is pressed; recognized students are marked in one transaction.
+
+    The work is split into stages joined by bounded drop-oldest queues:
+    a capture thread, one detection/landmark/liveness worker, a pool of
+    recognition workers, and the main thread which marks attendance and
+    draws the window (OpenCV windows must stay on the main thread).
+    A finite source (recorded clip, image folder) drops nothing: the stages
+    wait for each other and the run ends once the last frame has been
+    through every stage.
+    """
+    # Only new or changed photos are encoded, see EncodingGenerator
+    if GALLERY_SOURCE == "db" and record_attendance:
+        generate_encodings(sync_gallery_file=False)
+    gallery = load_gallery(export=record_attendance)
+    detector, predictor = initialize_dlib()
+    cap = source if source is not None else initialize_camera()
+    if headless is None:
+        headless = HEADLESS
+    if classroom is None:
+        classroom = CLASSROOM_MODE
+
+    stats = stats if stats is not None else StageStats()
+    stop = threading.Event()
+    source_done = threading.Event()
+    drop_oldest = not getattr(cap, "finite", False)
+    frames = DropOldestQueue(FRAME_QUEUE_SIZE, drop_oldest)
+    jobs = DropOldestQueue(RECOGNITION_QUEUE_SIZE, drop_oldest)
+    display = DropOldestQueue(FRAME_QUEUE_SIZE, drop_oldest)
+    results = queue.Queue()
+
+    # Faces are followed as tracks; blink state lives per track id in the
+    # liveness registry (detection worker only) and recognition results in
+    # the identity cache, so a recognized track is not encoded again
+    tracker = FaceTracker(detector, REDETECT_EVERY if FACE_TRACKING else 1,
+                          detection_scale=DETECTION_SCALE)
+    liveness = LivenessRegistry(ear_window=FRAME_BUFFER_SIZE, position_window=2)  # Smaller buffer for speed
+    identities = IdentityCache()
+    voter = TrackVoter(gallery, student_class) if RECOGNITION_VOTING else None
+
+    # Attendance is written in the background, the display loop never touches
+    # SQLite; the writer also knows who is already marked today
+    writer = AttendanceWriter(write_attendance_batch, load_marked_students) if record_attendance else None
+
+    def capture():
+        while not stop.is_set():
+            with stats.timed("capture"):
+                ret, frame = cap.read()
+            if not ret:
+                if isinstance(cap, WebcamSource):
+                    print("Camera error: Unable to read frame from camera")
+                    print("Please check if camera is connected and not being used by another application")
+                    stop.set()
+                else:
+                    # The main loop stops once the queued frames are processed
+                    print("Frame source finished")
+                    source_done.set()
+                break
+            frames.put((time.perf_counter(), frame))
+
+    def detect(item):
+        captured_at, frame = item
+        with stats.timed("detect"):
+            # Convert to grayscale for faster processing
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            now = time.monotonic()
+            liveness.expire(now)
+            identities.expire(now)
+            if voter is not None:
+                voter.expire(now)
+            stable = []
+            for track in tracker.update(gray):
+                # Re-verified every IDENTITY_TTL, marked students are then rejected by the writer
+                if identities.lookup(track.track_id, now) is not None:
+                    # Result still valid; re-verification needs a new blink
+                    liveness.discard(track.track_id)
+                    continue
+                state = liveness.get(track.track_id, now)
+                if is_face_stable(track.rect, state.position_buffer):
+                    stable.append((track, state))
+
+            # Get landmarks, then the EAR of every stable face at once
+            eyes = np.empty((len(stable), len(EYE_IDX), 2))
+            for i, (track, _) in enumerate(stable):
+                eyes[i] = landmarks_to_array(predictor(gray, track.rect))
+            ears = batch_EAR(eyes)
+
+            live_faces = []
+            for (track, state), avg_ear in zip(stable, ears):
+                state.blink_counter, state.consecutive_blinks = enhanced_blink_detection(
+                    avg_ear, state.blink_counter, state.consecutive_blinks, state.ear_buffer
+                )
+
+                if state.consecutive_blinks >= 2:
+                    state.live = True
+                    state.consecutive_blinks = 0  # Reset immediately
+
+                if state.live:
+                    # Jobs get the box of this frame: the tracker moves
+                    # track.rect on the next one while recognition still runs
+                    live_faces.append((track.track_id, track.rect))
+
+            if classroom and live_faces:
+                jobs.put((captured_at, frame, live_faces))
+            elif live_faces:
+                for face in live_faces:
+                    jobs.put((captured_at, frame, [face]))
+        display.put((captured_at, frame))
+
+    def recognize(item):
+        captured_at, frame, faces = item
+        # Faces recognized since this job was queued are skipped
+        faces = [(track_id, rect) for track_id, rect in faces if identities.lookup(track_id) is None]
+        if not faces:
+            return
+        with stats.timed("recognize"):
+            if voter is not None:
+                found = vote_on_faces(frame, faces, voter, batch=classroom)
+            elif classroom:
+                found = recognize_faces(frame, [rect for _, rect in faces], gallery, student_class)
+            else:
+                found = [process_face_recognition(frame, faces[0][1], gallery, student_class)]
+
+        matched = []
+        for (track_id, _), result in zip(faces, found):
+            if result is None:
+                continue  # still voting, the next frame adds another encoding
+            student, distance = result
+            if identities.store(track_id, student, distance):
+                matched.append(student)
+        if matched:
+            stats.record("capture_to_match", time.perf_counter() - captured_at)
+            results.put(matched)
+
+    capture_thread = threading.Thread(target=capture, name="capture", daemon=True)
+    capture_thread.start()
+    workers = [capture_thread, start_worker("detect", stop, frames, detect)]
+    workers += [start_worker(f"recognize-{i}", stop, jobs, recognize) for i in range(RECOGNITION_WORKERS)]
+
+    student = None  # last student whose attendance was marked
+    marked_ids = set()
+
+    def drained():
+        """Source finished and every frame and job went through its stage.
+
+        Checked upstream first: detect queues a frame's jobs and display
+        item before it marks the frame done.
+        """
+        return source_done.is_set() and frames.drained() and jobs.drained() and not len(display)
+
+    def mark_recognized():
+        """Hand everything recognized since the last call to the writer"""
+        nonlocal student
+        batch = []
+        while True:
+            try:
+                batch.extend(results.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        for recognized_student in batch:
+            if writer is not None:
+                writer.submit(recognized_student['id'])
+            if on_recognized:
+                on_recognized(recognized_student)
+            marked_ids.add(recognized_student['id'])
+        student = batch[-1]
 
     print("Starting face attendance system...")
-    print("Press ESC to close camera manually")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Camera error: Unable to read frame from camera")
-            print("Please check if camera is connected and not being used by another application")
-            break
+    if not headless:
+        print("Press ESC to close camera manually")
 
-        # Skip frames for better performance (process every 2nd frame)
-        frame_count += 1
-        if frame_count % 2 != 0:
+    while not stop.is_set():
+        try:
+            captured_at, frame = display.get(timeout=0.1)
+        except queue.Empty:
+            if drained():
+                break
             continue
 
-        # Convert to grayscale for faster processing
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # Use dlib with no upsampling for speed (0 instead of 1)
-        faces = detector(gray, 0)
-
-        for face in faces:
-            if not is_face_stable(face, face_position_buffer):
-                continue
-
-            # Get landmarks
-            landmarks = predictor(gray, face)
-            landmarks_points = np.array([[p.x, p.y] for p in landmarks.parts()])
-
-            left_eye = landmarks_points[LEFT_EYE_IDX]
-            right_eye = landmarks_points[RIGHT_EYE_IDX]
-
-            left_ear = calculate_EAR(left_eye)
-            right_ear = calculate_EAR(right_eye)
-            avg_ear = (left_ear + right_ear) / 2.0
-
-            blink_counter, consecutive_blinks = enhanced_blink_detection(
-                avg_ear, blink_counter, consecutive_blinks, ear_buffer
-            )
+        mark_recognized()
+        if headless:
+            stats.record("end_to_end", time.perf_counter() - captured_at)
+            continue
 
-            if consecutive_blinks >= 2:
-                process_live_face = True
-                consecutive_blinks = 0  # Reset immediately
+        # Draw on a copy, recognition workers may still be reading this frame
+        frame = frame.copy()
+        if student:
+            cv2.putText(frame, f"{student['name']} ({student['id']})", (30, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            cv2.putText(frame, "Attendance Marked!", (30, 70),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-            if process_live_face:
-                student = process_face_recognition(frame, face, encode_list_known, student_ids)
-                if student:
-                    cv2.putText(frame, f"{student['name']} ({student['id']})", (30, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    cv2.putText(frame, "Attendance Marked!", (30, 70),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    mark_attendance(student['id'])
-                    process_live_face = False
-                    attendance_marked = True
+        if classroom:
+            cv2.putText(frame, f"Students marked: {len(marked_ids)}", (30, 100),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
         # Display instructions
         cv2.putText(frame, "Blink twice to mark attendance", (10, 30),
@@ -338,24 +649,43 @@ def run_face_attendance():
         cv2.putText(frame, "Press ESC when done with attendance", (10, 60),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-        # Display FPS
-        elapsed = (datetime.now() - start_time).total_seconds()
-        fps = frame_count / elapsed if elapsed > 0 else 0
-        cv2.putText(frame, f"FPS: {fps:.1f}", (10, frame.shape[0] - 10),
+        # Display achieved FPS (frames that made it through every stage)
+        cv2.putText(frame, f"FPS: {stats.fps('display'):.1f}", (10, frame.shape[0] - 10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
-        cv2.imshow("Live Face Detection", frame)
-        if cv2.waitKey(1) & 0xFF == 27:  # ESC key
+        with stats.timed("display"):
+            cv2.imshow("Live Face Detection", frame)
+            key = cv2.waitKey(1) & 0xFF
+        stats.record("end_to_end", time.perf_counter() - captured_at)
+        if key == 27:  # ESC key
             break
 
+    stop.set()
+    for stage_queue in (frames, jobs, display):
+        stage_queue.close()  # after ESC, a stage waiting for room must not hang
+    for worker in workers:
+        worker.join(timeout=2)
+    mark_recognized()  # recognitions that finished while shutting down
+    if writer is not None:
+        writer.close()  # flush queued marks before returning
+
     cap.release()
-    cv2.destroyAllWindows()
-    
+    if not headless:
+        cv2.destroyAllWindows()
+
+    stats.report()
+    print(f"Full detections: {tracker.detections} of {tracker.frames} frames")
+    print(f"Identity cache: {identities.encodes} faces encoded, {identities.hits} lookups reused a result")
+    if writer is not None:
+        print(f"Attendance writer: {writer.written} marks in {writer.batches} batches, "
+              f"{writer.duplicates} duplicates skipped")
+    print(f"Dropped frames: capture->detect {frames.dropped}, detect->display {display.dropped}, "
+          f"recognition jobs {jobs.dropped}")
+
     # Return student data if attendance was marked, None otherwise
-    if attendance_marked:
-        return student if 'student' in locals() else None
-    return None
+    return student
 
 
 if __name__ == "__main__":
+    upgrade_schema(db_path)
     run_face_attendance()
\ No newline at end of file
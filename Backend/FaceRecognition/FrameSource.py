@@ -0,0 +1,171 @@
+"""Frame sources for the recognition loop.
+
+Every source has the same read()/release() interface as cv2.VideoCapture,
+so run_face_attendance can take frames from a webcam, a recorded clip or
+RTSP stream, a folder of images, or synthetic frames (for benchmarks and
+tests on machines without a camera).
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    """Base class: read() returns (ok, frame) like cv2.VideoCapture.
+
+    finite is True for replays that end (a recorded clip, an image folder):
+    run_face_attendance then processes every frame instead of dropping the
+    ones it cannot keep up with.
+    """
+
+    fps = 30.0
+    finite = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class _Pacer:
+    """Sleeps so frames come out no faster than `fps` (replay at stream speed)"""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self.next_time is None:
+            self.next_time = now
+        elif now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time = max(self.next_time + self.interval, time.perf_counter() - self.interval)
+
+
+class WebcamSource(FrameSource):
+    """Local camera with the low-latency settings the attendance loop needs"""
+
+    def __init__(self, index=0, width=640, height=480, fps=30):
+        self.cap = cv2.VideoCapture(index)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_FPS, fps)  # Set to 30 FPS
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce buffer size
+        self.fps = fps
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """Recorded clip or network stream (anything cv2.VideoCapture can open).
+
+    With realtime=True frames are released at the clip's own frame rate, so
+    replaying a recording has the timing of a live camera. A recording is
+    finite (unless looped) and processed completely; a stream (URL) is live
+    and, like the webcam, drops frames when the pipeline falls behind.
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.loop = loop
+        self.finite = not loop and "://" not in str(path)
+        self.cap = cv2.VideoCapture(path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.pacer = _Pacer(self.fps if realtime else 0)
+
+    def read(self):
+        self.pacer.wait()
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return ok, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """Images of a folder in name order, one per frame"""
+
+    def __init__(self, folder, fps=0, loop=False):
+        self.paths = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.loop = loop
+        self.finite = not loop
+        self.index = 0
+        self.fps = fps or 30.0
+        self.pacer = _Pacer(fps)
+
+    def read(self):
+        self.pacer.wait()
+        while self.index < len(self.paths) or (self.loop and self.paths):
+            path = self.paths[self.index % len(self.paths)]
+            self.index += 1
+            frame = cv2.imread(path)
+            if frame is not None:
+                return True, frame
+        return False, None
+
+
+class SyntheticSource(FrameSource):
+    """Generated frames for load tests.
+
+    Without `faces` the frames are plain noise (pipeline overhead only).
+    With a list of face images, each is pasted at a slowly drifting position
+    so detection and recognition have real work to do.
+    """
+
+    finite = True
+
+    def __init__(self, frames=300, width=640, height=480, fps=30, faces=None, seed=0):
+        self.frames = frames
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.faces = faces or []
+        self.rng = np.random.default_rng(seed)
+        self.index = 0
+        self.pacer = _Pacer(fps)
+
+    def read(self):
+        if self.index >= self.frames:
+            return False, None
+        self.pacer.wait()
+        frame = self.rng.integers(0, 40, (self.height, self.width, 3), dtype=np.uint8)
+
+        slot_width = self.width // max(len(self.faces), 1)
+        for i, face in enumerate(self.faces):
+            h, w = face.shape[:2]
+            drift = int(5 * np.sin(self.index / 15.0))
+            x = min(max(i * slot_width + (slot_width - w) // 2 + drift, 0), self.width - w)
+            y = min(max((self.height - h) // 2 + drift, 0), self.height - h)
+            frame[y:y + h, x:x + w] = face
+        self.index += 1
+        return True, frame
+
+
+def open_source(spec, realtime=True):
+    """Build a source from a string: a camera index ("0"), an image folder,
+    "synthetic[:frames]", or anything else cv2 can open (file path, rtsp:// URL)"""
+    spec = str(spec)
+    if spec.isdigit():
+        return WebcamSource(int(spec))
+    if spec.startswith("synthetic"):
+        frames = int(spec.split(":", 1)[1]) if ":" in spec else 300
+        return SyntheticSource(frames, fps=30 if realtime else 0)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, fps=30 if realtime else 0)
+    return VideoFileSource(spec, realtime=realtime)
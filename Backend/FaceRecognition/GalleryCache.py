@@ -0,0 +1,263 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from Backend.Database.DataAccess import connection
+from Backend.Database.Migrations import GALLERY_CHANGE_LOG_VERSION, schema_version
+from Backend.FaceRecognition.EncodingStore import decode_gallery_rows
+
+
+def database_identity(cursor):
+    """Stamp of the change log plus the schema version, stored with every snapshot"""
+    stamp = cursor.execute("SELECT stamp FROM face_encodings_log_info").fetchone()[0]
+    return f"{stamp}:{cursor.execute('PRAGMA user_version').fetchone()[0]}"
+
+
+def latest_seq(cursor):
+    """Highest seq ever logged (sqlite_sequence survives compaction of the log)"""
+    row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'face_encodings_log'").fetchone()
+    return row[0] if row else 0
+
+
+GALLERY_SQL = """
+    SELECT f.id, f.encoding, s.Class
+    FROM face_encodings f
+    LEFT JOIN Students s ON s.StudentID = f.id
+"""
+SQL_CHUNK = 500  # stay under SQLite's host parameter limit
+
+
+def changed_since(cursor, watermark):
+    """Ids logged after watermark, or None if the log was compacted past it"""
+    if watermark < latest_seq(cursor) and cursor.execute(
+            "SELECT 1 FROM face_encodings_log WHERE seq = ?", (watermark + 1,)).fetchone() is None:
+        return None
+    cursor.execute("SELECT DISTINCT id FROM face_encodings_log WHERE seq > ?", (watermark,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def fetch_gallery_rows(cursor, student_ids=None):
+    """(id, blob, class) rows of the given ids, or of the whole gallery"""
+    if student_ids is None:
+        return cursor.execute(GALLERY_SQL).fetchall()
+    rows = []
+    for i in range(0, len(student_ids), SQL_CHUNK):
+        chunk = student_ids[i:i + SQL_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"{GALLERY_SQL} WHERE f.id IN ({placeholders})", chunk)
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+SNAPSHOT_POINTER = "snapshot.json"
+
+
+def export_snapshot(snapshot_dir, encodings, student_ids, student_classes, watermark, extra=None):
+    """Write the gallery as a memory-mappable snapshot.
+
+    Rows are sorted by class so every class partition is a contiguous slice.
+    The .npy files carry a version in their name and snapshot.json (replaced
+    atomically) points at the current one, so readers never see a half
+    written snapshot. Returns the snapshot metadata.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    has_class = np.array([c is not None for c in student_classes], dtype=bool)
+    labels = np.array(["" if c is None else str(c) for c in student_classes])
+    # Students with a class first (grouped by class), unassigned ones last
+    order = np.lexsort((labels, ~has_class)) if len(labels) else np.zeros(0, dtype=np.int64)
+
+    encodings = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32)[order])
+    arrays = {
+        "encodings": encodings,
+        "norms": np.einsum("ij,ij->i", encodings, encodings),
+        "student_ids": np.asarray(student_ids, dtype=np.int64)[order],
+    }
+
+    class_ranges = {}
+    sorted_labels = labels[order][has_class[order]]
+    if len(sorted_labels):
+        names, starts, counts = np.unique(sorted_labels, return_index=True, return_counts=True)
+        class_ranges = {str(n): [int(s), int(s + c)] for n, s, c in zip(names, starts, counts)}
+
+    version = f"{watermark}-{os.getpid()}-{time.time_ns()}"
+    for name, array in arrays.items():
+        np.save(os.path.join(snapshot_dir, f"{name}-{version}.npy"), array)
+
+    meta = dict(extra or {}, version=version, watermark=watermark,
+                count=int(encodings.shape[0]), class_ranges=class_ranges)
+    pointer = os.path.join(snapshot_dir, SNAPSHOT_POINTER)
+    with open(pointer + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(pointer + ".tmp", pointer)
+
+    # Old versions can go; processes that still map them keep their pages
+    for file_name in os.listdir(snapshot_dir):
+        if file_name.endswith(".npy") and not file_name.endswith(f"-{version}.npy"):
+            try:
+                os.remove(os.path.join(snapshot_dir, file_name))
+            except OSError:
+                pass
+    return meta
+
+
+def load_snapshot(snapshot_dir):
+    """Map the current snapshot read-only, returns (meta, arrays) or None.
+
+    Nothing is read up front: the OS pages the data in on first use and
+    shares those pages between every process mapping the same files.
+    """
+    try:
+        with open(os.path.join(snapshot_dir, SNAPSHOT_POINTER)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(snapshot_dir, f"{name}-{meta['version']}.npy"), mmap_mode="r")
+            for name in ("encodings", "norms", "student_ids")
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    return meta, arrays
+
+
+class GalleryCache:
+    """Persistent copy of face_encodings (with classes) that is refreshed incrementally.
+
+    The cache is a memory-mapped snapshot (see export_snapshot) together with
+    the change log watermark it reflects and the identity of the database it
+    came from. On refresh only ids logged after that watermark are re-read
+    from SQLite, so worker startup does not depend on gallery or school
+    size. Once a snapshot is exported, the log rows it covers are deleted; a
+    process still behind that point maps the newer snapshot first.
+    """
+
+    def __init__(self, db_path, snapshot_dir):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.encodings = None
+        self.norms = None
+        self.student_ids = None
+        self.class_ranges = None
+        self.student_classes = None  # only used when no snapshot could be written
+        self.watermark = None
+        self.identity = None
+
+    def _map_snapshot(self, identity):
+        """Map the snapshot on disk if it is of this database and newer than what we hold"""
+        snapshot = load_snapshot(self.snapshot_dir)
+        if snapshot is None:
+            return False
+        meta, arrays = snapshot
+        if meta.get("db_path") != os.path.abspath(self.db_path) or meta.get("db_identity") != identity:
+            return False
+        if self.watermark is not None and meta["watermark"] <= self.watermark:
+            return False
+        self.encodings = arrays["encodings"]
+        self.norms = arrays["norms"]
+        self.student_ids = arrays["student_ids"]
+        self.class_ranges = meta["class_ranges"]
+        self.student_classes = None
+        self.watermark = meta["watermark"]
+        self.identity = identity
+        return True
+
+    def _row_classes(self):
+        """Class of every row, expanded from the snapshot's class ranges when needed"""
+        if self.student_classes is not None:
+            return list(self.student_classes)
+        classes = [None] * len(self.student_ids)
+        for student_class, (start, end) in self.class_ranges.items():
+            classes[start:end] = [student_class] * (end - start)
+        return classes
+
+    def _full_load(self, cursor):
+        self.encodings, self.student_ids, self.student_classes = decode_gallery_rows(fetch_gallery_rows(cursor))
+
+    def _apply_changes(self, cursor, changed_ids):
+        rows = fetch_gallery_rows(cursor, changed_ids)
+
+        # Drop every changed id, then append the rows that still exist
+        keep = ~np.isin(self.student_ids, np.asarray(changed_ids, dtype=np.int64))
+        classes = [c for c, k in zip(self._row_classes(), keep) if k]
+        new_encodings, new_ids, new_classes = decode_gallery_rows(rows)
+        self.encodings = np.concatenate([self.encodings[keep], new_encodings])
+        self.student_ids = np.concatenate([self.student_ids[keep], new_ids])
+        self.student_classes = classes + new_classes
+
+    def refresh(self, export=True):
+        """Bring the cache up to date, returns True if the gallery changed.
+
+        The change log comes from the schema migrations. With export=False
+        (benchmarks) nothing is written: no snapshot, no log compaction, the
+        cache is only kept in memory.
+        """
+        with connection(self.db_path) as conn:
+            if schema_version(conn) < GALLERY_CHANGE_LOG_VERSION:
+                raise RuntimeError(f"{self.db_path} has no gallery change log yet, "
+                                   f"run: python -m Backend.Database.Migrations")
+            cursor = conn.cursor()
+            # One read transaction so the watermark matches the rows we read
+            cursor.execute("BEGIN")
+            identity = database_identity(cursor)
+            latest = latest_seq(cursor)
+
+            if self.identity != identity:
+                self.watermark = None
+            # Another process may have exported (and compacted the log) past our watermark
+            remapped = (self.watermark is None or self.watermark < latest) and self._map_snapshot(identity)
+            if remapped:
+                print(f"Mapped gallery snapshot: {len(self.student_ids)} encodings")
+
+            changed = True
+            changed_ids = None
+            if self.watermark is not None and self.watermark <= latest:
+                changed_ids = changed_since(cursor, self.watermark)
+            if changed_ids is None:
+                self._full_load(cursor)
+                print(f"Gallery cache rebuilt: {len(self.student_ids)} encodings")
+            elif changed_ids:
+                self._apply_changes(cursor, changed_ids)
+                print(f"Gallery cache updated: {len(changed_ids)} changed ids")
+            else:
+                changed = remapped
+            conn.commit()
+            if self.watermark == latest:
+                return changed
+
+            student_classes = self._row_classes()
+            mapped = False
+            if export:
+                try:
+                    export_snapshot(self.snapshot_dir, self.encodings, self.student_ids, student_classes, latest,
+                                    extra={"db_path": os.path.abspath(self.db_path), "db_identity": identity})
+                    self.watermark = None
+                    mapped = self._map_snapshot(identity)
+                except OSError as e:
+                    print(f"Could not write gallery snapshot: {e}")
+
+            if mapped:
+                # The snapshot on disk (ours, or a concurrent export) covers these log rows
+                with conn:
+                    conn.execute("DELETE FROM face_encodings_log WHERE seq <= ?", (self.watermark,))
+            else:
+                # Keep serving from memory, grouped by the per-row classes instead
+                self.norms = None
+                self.class_ranges = None
+                self.student_classes = student_classes
+                self.watermark = latest
+                self.identity = identity
+        return True
+
+
+if __name__ == "__main__":
+    # Read-only check of the snapshot against the database; the app exports
+    # a new snapshot itself when it loads the gallery
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    db_path = os.path.join(os.path.dirname(BASE_DIR), "Database", "school_portal.db")
+    snapshot_dir = os.path.join(BASE_DIR, "gallery_snapshot")
+
+    cache = GalleryCache(db_path, snapshot_dir)
+    cache.refresh(export=False)
+    state = "current" if cache.class_ranges is not None else "missing or stale"
+    print(f"Gallery: {len(cache.student_ids)} encodings, snapshot at {snapshot_dir} is {state}")
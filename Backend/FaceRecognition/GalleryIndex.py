@@ -0,0 +1,285 @@
+import numpy as np
+
+# Default match tolerance (same value FaceMain used with compare_faces)
+DEFAULT_TOLERANCE = 0.5
+ENCODING_DIM = 128
+
+
+def _squared_distances(a, b, b_norms):
+    """Squared distances between rows of a and rows of b"""
+    # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b  (one BLAS call for all pairs)
+    d2 = a @ b.T
+    d2 *= -2.0
+    d2 += np.einsum("ij,ij->i", a, a)[:, None]
+    d2 += b_norms[None, :]
+    np.maximum(d2, 0.0, out=d2)
+    return d2
+
+
+class FaceGallery:
+    """In-memory index over all known face encodings.
+
+    Encodings are kept in one contiguous float32 matrix together with their
+    squared norms, so a lookup is a single matrix-vector product instead of
+    compare_faces + face_distance over a Python list. Arrays that are
+    already float32 and contiguous (e.g. a memory-mapped snapshot) are used
+    as-is without copying.
+    """
+
+    def __init__(self, encodings, student_ids, tolerance=DEFAULT_TOLERANCE, norms=None):
+        matrix = np.asarray(encodings, dtype=np.float32)
+        self.matrix = np.ascontiguousarray(matrix.reshape(-1, ENCODING_DIM))
+        self.student_ids = np.asarray(student_ids)
+        self.tolerance = tolerance
+
+        if len(self.student_ids) != self.matrix.shape[0]:
+            raise ValueError("encodings and student_ids must have the same length")
+
+        # Precompute ||g||^2 once, reused by every query
+        if norms is None:
+            norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.norms = norms
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def squared_distances(self, queries):
+        """Squared euclidean distances, shape (n_queries, n_gallery)"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        return _squared_distances(queries, self.matrix, self.norms)
+
+    def _select(self, d2, candidates, k, tolerance):
+        """Pick the k closest of `candidates` given their squared distances"""
+        k = min(k, d2.shape[0])
+        if k == 0:
+            return []
+
+        # argpartition avoids a full sort when there are many candidates
+        if k < d2.shape[0]:
+            top = np.argpartition(d2, k - 1)[:k]
+        else:
+            top = np.arange(d2.shape[0])
+        top = top[np.argsort(d2[top])]
+        distances = np.sqrt(d2[top])
+
+        if tolerance is not False:
+            keep = distances <= tolerance
+            top, distances = top[keep], distances[keep]
+        ids = self.student_ids[candidates[top]].tolist()
+        return list(zip(ids, distances.tolist()))
+
+    def query_batch(self, queries, k=1, tolerance=None):
+        """Top-k matches for every query encoding.
+
+        Returns one list per query of (student_id, distance) pairs sorted by
+        distance. Candidates farther than the tolerance are dropped; pass
+        tolerance=False to keep them (useful for margin checks).
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(self) == 0 or queries.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        if tolerance is None:
+            tolerance = self.tolerance
+
+        d2 = self.squared_distances(queries)
+        everyone = np.arange(len(self))
+        return [self._select(row, everyone, k, tolerance) for row in d2]
+
+    def query(self, encoding, k=1, tolerance=None):
+        """Top-k matches for a single encoding"""
+        return self.query_batch(encoding, k=k, tolerance=tolerance)[0]
+
+    def best_match(self, encoding, tolerance=None):
+        """Return (student_id, distance) of the closest match within tolerance, or None"""
+        matches = self.query(encoding, k=1, tolerance=tolerance)
+        return matches[0] if matches else None
+
+
+def kmeans(data, n_clusters, iterations=10, seed=0):
+    """Plain Lloyd's k-means, returns (centroids, assignment)"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(data.shape[0], n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        d2 = _squared_distances(data, centroids, np.einsum("ij,ij->i", centroids, centroids))
+        assign = np.argmin(d2, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=n_clusters)
+
+        # Empty clusters keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+
+    d2 = _squared_distances(data, centroids, np.einsum("ij,ij->i", centroids, centroids))
+    return centroids, np.argmin(d2, axis=1)
+
+
+class IVFFaceGallery(FaceGallery):
+    """Approximate gallery using an inverted file (IVF) index.
+
+    The gallery is split into `n_lists` k-means cells; a query only scans
+    the `n_probe` cells whose centroids are closest to it. Rows are stored
+    grouped by cell so each probed cell is a contiguous slice of the matrix.
+    Small galleries fall back to the exact scan.
+    """
+
+    MIN_SIZE = 2048  # below this the exact scan is already cheap
+    TRAIN_SAMPLE = 20000
+
+    def __init__(self, encodings, student_ids, tolerance=DEFAULT_TOLERANCE,
+                 n_lists=None, n_probe=8, iterations=10, seed=0):
+        super().__init__(encodings, student_ids, tolerance)
+        self.n_probe = n_probe
+        self.centroids = None
+
+        if len(self) < self.MIN_SIZE:
+            return
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(self)))
+        n_lists = max(1, min(n_lists, len(self)))
+
+        # Train on a sample, then assign every row to its nearest cell
+        rng = np.random.default_rng(seed)
+        sample = self.matrix
+        if len(self) > self.TRAIN_SAMPLE:
+            sample = self.matrix[rng.choice(len(self), self.TRAIN_SAMPLE, replace=False)]
+        self.centroids, _ = kmeans(sample, n_lists, iterations, seed)
+        self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        assign = np.argmin(
+            _squared_distances(self.matrix, self.centroids, self.centroid_norms), axis=1)
+
+        # Reorder rows so each cell is a contiguous block
+        order = np.argsort(assign, kind="stable")
+        self.matrix = np.ascontiguousarray(self.matrix[order])
+        self.norms = self.norms[order]
+        self.student_ids = self.student_ids[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+
+    def query_batch(self, queries, k=1, tolerance=None):
+        if self.centroids is None:
+            return super().query_batch(queries, k, tolerance)
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if tolerance is None:
+            tolerance = self.tolerance
+
+        # Coarse step: nearest cells for all queries at once
+        n_probe = min(self.n_probe, self.centroids.shape[0])
+        coarse = _squared_distances(queries, self.centroids, self.centroid_norms)
+        probes = np.argpartition(coarse, n_probe - 1, axis=1)[:, :n_probe]
+
+        results = []
+        for query, cells in zip(queries, probes):
+            candidates = np.concatenate(
+                [np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+            d2 = _squared_distances(query[None, :], self.matrix[candidates],
+                                    self.norms[candidates])[0]
+            results.append(self._select(d2, candidates, k, tolerance))
+        return results
+
+
+class ClassPartitionedGallery:
+    """Global gallery plus one small exact gallery per class.
+
+    Lookups with a class filter only scan that class (~40 students) and fall
+    back to the whole school only when the class partition has no match.
+    When a class's rows are contiguous (as in a gallery snapshot, which is
+    sorted by class) its partition is a view, not a copy.
+    """
+
+    def __init__(self, encodings, student_ids, student_classes, backend="exact", norms=None,
+                 class_ranges=None, **options):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        student_ids = np.asarray(student_ids)
+        if norms is None:
+            norms = np.einsum("ij,ij->i", encodings, encodings)
+        if backend == "exact":
+            options["norms"] = norms
+        self.global_gallery = build_gallery(encodings, student_ids, backend, **options)
+
+        tolerance = options.get("tolerance", DEFAULT_TOLERANCE)
+        self.tolerance = tolerance
+        if class_ranges is None:
+            class_ranges = {}
+            for index, student_class in enumerate(student_classes):
+                if student_class is not None:
+                    class_ranges.setdefault(str(student_class), []).append(index)
+        else:
+            # Snapshot rows are grouped by class: {class: (start, end)}
+            class_ranges = {c: slice(start, end) for c, (start, end) in class_ranges.items()}
+
+        self.partitions = {}
+        for student_class, indices in class_ranges.items():
+            if isinstance(indices, list) and indices[-1] - indices[0] + 1 == len(indices):
+                indices = slice(indices[0], indices[-1] + 1)
+            self.partitions[student_class] = FaceGallery(
+                encodings[indices], student_ids[indices], tolerance, norms[indices])
+
+    def __len__(self):
+        return len(self.global_gallery)
+
+    def query_batch(self, queries, k=1, tolerance=None, student_class=None):
+        partition = None
+        if student_class is not None:
+            partition = self.partitions.get(str(student_class))
+        if partition is None:
+            return self.global_gallery.query_batch(queries, k, tolerance)
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        results = partition.query_batch(queries, k, tolerance)
+
+        # Only the queries the class partition could not match hit the global gallery
+        misses = [i for i, result in enumerate(results) if not result]
+        if misses:
+            for i, result in zip(misses, self.global_gallery.query_batch(queries[misses], k, tolerance)):
+                results[i] = result
+        return results
+
+    def query(self, encoding, k=1, tolerance=None, student_class=None):
+        return self.query_batch(encoding, k, tolerance, student_class)[0]
+
+    def query_margin(self, queries, tolerance=None, student_class=None):
+        """Best and second-best (student_id, distance) per query, for margin checks.
+
+        The class partition answers when its best match is within tolerance,
+        otherwise the whole school does. Either pair is None when there is
+        no such candidate; nothing is filtered by tolerance.
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        results = [None] * queries.shape[0]
+
+        partition = self.partitions.get(str(student_class)) if student_class is not None else None
+        if partition is not None:
+            for i, result in enumerate(partition.query_batch(queries, 2, False)):
+                if result and result[0][1] <= tolerance:
+                    results[i] = result
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            for i, result in zip(misses, self.global_gallery.query_batch(queries[misses], 2, False)):
+                results[i] = result
+        return [(result[0] if result else None, result[1] if len(result) > 1 else None)
+                for result in results]
+
+    def best_match(self, encoding, tolerance=None, student_class=None):
+        matches = self.query(encoding, 1, tolerance, student_class)
+        return matches[0] if matches else None
+
+
+GALLERY_BACKENDS = {
+    "exact": FaceGallery,
+    "ivf": IVFFaceGallery,
+}
+
+
+def build_gallery(encodings, student_ids, backend="exact", **options):
+    """Create a gallery index for the configured backend ("exact" or "ivf")"""
+    if backend not in GALLERY_BACKENDS:
+        raise ValueError(f"Unknown gallery backend: {backend}")
+    return GALLERY_BACKENDS[backend](encodings, student_ids, **options)
@@ -0,0 +1,105 @@
+"""Recognition results remembered per face track.
+
+Once a tracked face has been encoded and matched, later frames of the same
+track reuse the result instead of running the ResNet encoder again. A
+confident match is trusted for IDENTITY_TTL seconds, a borderline one is
+re-checked sooner, and a face that matched nobody is retried after
+UNKNOWN_TTL, so an unknown visitor is not encoded on every frame.
+"""
+import threading
+import time
+
+from Backend.FaceRecognition.GalleryIndex import DEFAULT_TOLERANCE
+
+# Seconds a confident match is reused before the track is verified again
+IDENTITY_TTL = 30.0
+# Matches below this confidence (1 - distance / tolerance) are re-checked
+# after LOW_CONFIDENCE_TTL instead
+MIN_IDENTITY_CONFIDENCE = 0.2
+LOW_CONFIDENCE_TTL = 2.0
+# A face that matched nobody is encoded again after this many seconds
+UNKNOWN_TTL = 1.0
+MAX_IDENTITY_ENTRIES = 256
+
+
+class IdentityEntry:
+    """Last recognition result of one track"""
+
+    __slots__ = ("student", "distance", "confidence", "expires", "encodes")
+
+    def __init__(self):
+        self.student = None
+        self.distance = None
+        self.confidence = 0.0
+        self.expires = 0.0
+        self.encodes = 0
+
+
+class IdentityCache:
+    """IdentityEntry per track id, shared by the detection and recognition threads"""
+
+    def __init__(self, ttl=IDENTITY_TTL, low_confidence_ttl=LOW_CONFIDENCE_TTL, unknown_ttl=UNKNOWN_TTL,
+                 min_confidence=MIN_IDENTITY_CONFIDENCE, tolerance=DEFAULT_TOLERANCE,
+                 max_entries=MAX_IDENTITY_ENTRIES):
+        self.ttl = ttl
+        self.low_confidence_ttl = low_confidence_ttl
+        self.unknown_ttl = unknown_ttl
+        self.min_confidence = min_confidence
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.encodes = 0
+
+    def lookup(self, track_id, now=None):
+        """The cached entry if it is still valid, else None (the track needs encoding).
+
+        Expired matches are never renewed without encoding again, also for
+        students already marked: another student who steps into the same
+        spot may have taken over the track.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(track_id)
+            if entry is None or entry.expires < now:
+                return None
+            self.hits += 1
+            return entry
+
+    def store(self, track_id, student, distance, now=None):
+        """Record a recognition result, returns True if the track's identity changed"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(track_id)
+            if entry is None:
+                if len(self.entries) >= self.max_entries:
+                    oldest = min(self.entries, key=lambda i: self.entries[i].expires)
+                    del self.entries[oldest]
+                entry = self.entries[track_id] = IdentityEntry()
+
+            changed = (student and student["id"]) != (entry.student and entry.student["id"])
+            entry.student = student
+            entry.distance = distance
+            entry.encodes += 1
+            self.encodes += 1
+            if student is None:
+                entry.confidence = 0.0
+                entry.expires = now + self.unknown_ttl
+            else:
+                entry.confidence = max(0.0, 1.0 - distance / self.tolerance)
+                confident = entry.confidence >= self.min_confidence
+                entry.expires = now + (self.ttl if confident else self.low_confidence_ttl)
+            return changed and student is not None
+
+    def expire(self, now=None):
+        """Forget tracks whose result expired more than a ttl ago (they left the frame)"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            stale = [i for i, entry in self.entries.items() if entry.expires + self.ttl < now]
+            for track_id in stale:
+                del self.entries[track_id]
+        return len(stale)
+
+    def __len__(self):
+        return len(self.entries)
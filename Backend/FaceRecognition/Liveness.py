@@ -0,0 +1,100 @@
+"""Per-face liveness state for the blink check.
+
+Every tracked face gets its own LivenessState (blink counters plus small
+ring buffers of recent EAR values and face positions), kept in a
+LivenessRegistry keyed by track id. States of faces that left the frame
+expire, so memory stays bounded however many people walk past.
+"""
+import time
+
+import numpy as np
+
+# Liveness state of a face not seen for this long is dropped
+LIVENESS_TTL = 2.0
+# Upper bound on states kept at once, the least recently seen go first
+MAX_LIVENESS_STATES = 256
+
+
+class RingBuffer:
+    """Fixed-size numpy ring buffer of rows, supports append, len and
+    negative indexing like the deques it replaces"""
+
+    __slots__ = ("values", "capacity", "count", "head")
+
+    def __init__(self, capacity, width=1):
+        self.values = np.zeros((capacity, width), dtype=np.float64)
+        self.capacity = capacity
+        self.count = 0
+        self.head = 0  # next slot to write
+
+    def append(self, value):
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError("ring buffer index out of range")
+        if index < 0:
+            index += self.count
+        row = self.values[(self.head - self.count + index) % self.capacity]
+        return row[0] if row.shape[0] == 1 else row
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+
+
+class LivenessState:
+    """Blink counters and recent history of one face"""
+
+    __slots__ = ("ear_buffer", "position_buffer", "blink_counter", "consecutive_blinks", "live", "last_seen")
+
+    def __init__(self, ear_window, position_window, now):
+        self.ear_buffer = RingBuffer(ear_window)
+        self.position_buffer = RingBuffer(position_window, 4)  # x, y, w, h
+        self.blink_counter = 0
+        self.consecutive_blinks = 0
+        self.live = False
+        self.last_seen = now
+
+
+class LivenessRegistry:
+    """LivenessState per track id, with expiry (used from one thread only)"""
+
+    def __init__(self, ear_window=3, position_window=2, ttl=LIVENESS_TTL, max_states=MAX_LIVENESS_STATES):
+        self.ear_window = ear_window
+        self.position_window = position_window
+        self.ttl = ttl
+        self.max_states = max_states
+        self.states = {}
+
+    def get(self, track_id, now=None):
+        """State for this track, created on first sight"""
+        now = time.monotonic() if now is None else now
+        state = self.states.get(track_id)
+        if state is None:
+            if len(self.states) >= self.max_states:
+                oldest = min(self.states, key=lambda i: self.states[i].last_seen)
+                del self.states[oldest]
+            state = self.states[track_id] = LivenessState(self.ear_window, self.position_window, now)
+        state.last_seen = now
+        return state
+
+    def expire(self, now=None):
+        """Drop states not seen within the ttl, returns how many were dropped"""
+        now = time.monotonic() if now is None else now
+        stale = [i for i, state in self.states.items() if now - state.last_seen > self.ttl]
+        for track_id in stale:
+            del self.states[track_id]
+        return len(stale)
+
+    def discard(self, track_id):
+        """Forget a track's state, e.g. once it was recognized"""
+        self.states.pop(track_id, None)
+
+    def __len__(self):
+        return len(self.states)
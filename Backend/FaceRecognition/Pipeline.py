@@ -0,0 +1,165 @@
+"""Small threading helpers for the staged recognition loop in FaceMain.
+
+Stages run in their own threads and are joined by bounded queues that drop
+the oldest item when full, so a slow stage only ever works on recent frames
+instead of making the camera wait. Replaying a recording is the exception:
+there every frame has to be processed, so the queues wait for room instead.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class DropOldestQueue:
+    """Bounded queue whose put() never blocks: when full, the oldest item is discarded.
+
+    With drop_oldest=False put() waits for room instead, until close() is
+    called. Items count as unfinished until the consumer calls task_done(),
+    so drained() tells when everything put has been handled.
+    """
+
+    def __init__(self, maxsize, drop_oldest=True):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        self.unfinished = 0
+        self.closed = False
+        lock = threading.Lock()
+        self.not_empty = threading.Condition(lock)
+        self.not_full = threading.Condition(lock)
+
+    def put(self, item):
+        with self.not_full:
+            if self.drop_oldest:
+                if len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    self.dropped += 1
+                    self.unfinished -= 1
+            else:
+                self.not_full.wait_for(lambda: len(self.items) < self.maxsize or self.closed)
+                if self.closed:
+                    return
+            self.items.append(item)
+            self.unfinished += 1
+            self.not_empty.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, raises queue.Empty after timeout"""
+        with self.not_empty:
+            if not self.not_empty.wait_for(lambda: self.items, timeout):
+                raise queue.Empty
+            item = self.items.popleft()
+            self.not_full.notify()
+            return item
+
+    def task_done(self):
+        """The consumer finished an item taken with get()"""
+        with self.not_empty:
+            self.unfinished -= 1
+
+    def drained(self):
+        """Every item put has been taken and finished"""
+        with self.not_empty:
+            return self.unfinished == 0
+
+    def close(self):
+        """Wake up producers waiting for room, later puts are discarded"""
+        with self.not_full:
+            self.closed = True
+            self.not_full.notify_all()
+
+    def __len__(self):
+        with self.not_empty:
+            return len(self.items)
+
+
+class StageStats:
+    """Thread-safe latency samples per stage plus processed frame counts"""
+
+    WINDOW = 1000  # keep the most recent samples per stage
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counts = {}
+        self.start = time.perf_counter()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.WINDOW)).append(seconds * 1000)
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def timed(self, stage):
+        """Context manager that records how long its block took"""
+        return _Timer(self, stage)
+
+    def fps(self, stage):
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            return self.counts.get(stage, 0) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """{stage: {"count", "fps", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}}"""
+        with self.lock:
+            snapshot = {stage: (self.counts[stage], np.array(values)) for stage, values in self.samples.items()}
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return {
+            stage: {
+                "count": count,
+                "fps": count / elapsed,
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+                "p99_ms": float(np.percentile(values, 99)),
+            }
+            for stage, (count, values) in snapshot.items()
+        }
+
+    def report(self):
+        print(f"{'stage':<18}{'count':>8}{'fps':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for stage, s in self.summary().items():
+            print(f"{stage:<18}{s['count']:>8}{s['fps']:>8.1f}{s['mean_ms']:>10.1f}"
+                  f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}")
+
+
+class _Timer:
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def start_worker(name, stop_event, source, handler):
+    """Run handler(item) for every item taken from `source` until stop_event is set.
+
+    Exceptions in the handler are printed and the worker keeps going, so one
+    bad frame cannot stop the loop. Every item is marked done afterwards
+    (see DropOldestQueue.drained).
+    """
+    def loop():
+        while not stop_event.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                handler(item)
+            except Exception as e:
+                print(f"{name} error: {e}")
+            finally:
+                source.task_done()
+
+    thread = threading.Thread(target=loop, name=name, daemon=True)
+    thread.start()
+    return thread
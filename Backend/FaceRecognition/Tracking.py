@@ -0,0 +1,150 @@
+"""Detection-then-tracking for the recognition loop.
+
+HOG detection is the most expensive per-frame step, so FaceTracker only runs
+it every `redetect_every` frames (or sooner when a track's confidence
+drops) and follows the faces with dlib correlation trackers in between.
+Each face keeps a Track across frames; its id keys the face's liveness
+state (see Liveness) and recognition result (see IdentityCache).
+"""
+import cv2
+import dlib
+
+# Full HOG detection every N frames, trackers in between
+REDETECT_EVERY = 10
+# correlation_tracker.update() returns a peak-to-sidelobe ratio; below this
+# the track is considered lost and detection runs on the current frame
+MIN_TRACK_CONFIDENCE = 7.0
+# Detections overlapping a track by at least this IoU continue that track
+IOU_MATCH_THRESHOLD = 0.3
+# Detection rounds a track may go unmatched before it is dropped
+MAX_MISSED_DETECTIONS = 1
+
+
+def iou(a, b):
+    """Intersection over union of two dlib rectangles"""
+    left, top = max(a.left(), b.left()), max(a.top(), b.top())
+    right, bottom = min(a.right(), b.right()), min(a.bottom(), b.bottom())
+    if right < left or bottom < top:
+        return 0.0
+    inter = (right - left + 1) * (bottom - top + 1)
+    return inter / float(a.area() + b.area() - inter)
+
+
+def detect_faces(detector, gray, scale=1.0):
+    """Run the HOG detector on a downscaled copy of `gray`, returns boxes in
+    full-resolution coordinates (landmarks and encodings use the full frame)"""
+    if scale == 1.0:
+        # Use dlib with no upsampling for speed (0 instead of 1)
+        return list(detector(gray, 0))
+    small = cv2.resize(gray, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    height, width = gray.shape[:2]
+    return [dlib.rectangle(max(0, int(rect.left() / scale)), max(0, int(rect.top() / scale)),
+                           min(width - 1, int((rect.right() + 1) / scale) - 1),
+                           min(height - 1, int((rect.bottom() + 1) / scale) - 1))
+            for rect in detector(small, 0)]
+
+
+def _to_rectangle(position):
+    return dlib.rectangle(int(round(position.left())), int(round(position.top())),
+                          int(round(position.right())), int(round(position.bottom())))
+
+
+class Track:
+    """One face followed across frames"""
+
+    def __init__(self, track_id, gray, rect, use_tracker=True):
+        self.track_id = track_id
+        self.tracker = dlib.correlation_tracker() if use_tracker else None
+        self.rect = None
+        self.confidence = float("inf")
+        self.missed = 0
+        self.restart(gray, rect)
+
+    def restart(self, gray, rect):
+        """Snap the tracker back onto a fresh detection"""
+        if self.tracker is not None:
+            self.tracker.start_track(gray, rect)
+        self.rect = rect
+        self.confidence = float("inf")
+        self.missed = 0
+
+    def follow(self, gray):
+        """Move the box with the correlation tracker, returns its confidence"""
+        if self.tracker is None:
+            return self.confidence
+        self.confidence = self.tracker.update(gray)
+        self.rect = _to_rectangle(self.tracker.get_position())
+        return self.confidence
+
+
+class FaceTracker:
+    """Keeps Tracks for the faces in view, see module docstring.
+
+    With redetect_every=1 every frame is detected and the correlation
+    trackers are never used; faces are still associated by IoU so their
+    state persists.
+    """
+
+    def __init__(self, detector, redetect_every=REDETECT_EVERY, min_confidence=MIN_TRACK_CONFIDENCE,
+                 iou_threshold=IOU_MATCH_THRESHOLD, detection_scale=1.0):
+        self.detector = detector
+        self.detection_scale = detection_scale
+        self.redetect_every = max(1, redetect_every)
+        self.use_trackers = self.redetect_every > 1
+        self.min_confidence = min_confidence
+        self.iou_threshold = iou_threshold
+        self.tracks = []
+        self.next_id = 1
+        self.frames = 0
+        self.detections = 0
+        self.since_detection = None
+
+    def update(self, gray):
+        """Advance every track to this grayscale frame, returns the live tracks"""
+        self.frames += 1
+        detect = self.since_detection is None or self.since_detection + 1 >= self.redetect_every
+
+        # Tracks are followed on detection frames too, so the ones a detection
+        # misses keep an up-to-date box
+        if self.use_trackers:
+            for track in self.tracks:
+                if track.follow(gray) < self.min_confidence:
+                    detect = True
+
+        if detect:
+            self._detect(gray)
+            self.since_detection = 0
+        else:
+            self.since_detection += 1
+        return self.tracks
+
+    def _detect(self, gray):
+        self.detections += 1
+        rects = detect_faces(self.detector, gray, self.detection_scale)
+
+        # Greedy association, best overlapping pairs first
+        pairs = sorted(((iou(track.rect, rect), t, r) for t, track in enumerate(self.tracks)
+                        for r, rect in enumerate(rects)), key=lambda p: p[0], reverse=True)
+        matched_tracks, matched_rects = set(), set()
+        for overlap, t, r in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or r in matched_rects:
+                continue
+            self.tracks[t].restart(gray, rects[r])
+            matched_tracks.add(t)
+            matched_rects.add(r)
+
+        kept = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if track.missed > MAX_MISSED_DETECTIONS:
+                    continue
+            kept.append(track)
+
+        for r, rect in enumerate(rects):
+            if r not in matched_rects:
+                kept.append(Track(self.next_id, gray, rect, self.use_trackers))
+                self.next_id += 1
+        self.tracks = kept
@@ -0,0 +1,95 @@
+"""Multi-frame recognition decisions per face track.
+
+Instead of accepting the first frame whose encoding is within tolerance,
+the encodings of a track are averaged over up to VOTE_WINDOW frames and the
+mean is matched with ClassPartitionedGallery.query_margin. A student is
+accepted once the best match is within tolerance and clearly ahead of the
+second best:
+
+- one frame is enough when the margin is at least VOTE_EARLY_MARGIN
+  (easy cases cost nothing extra),
+- otherwise VOTE_MIN_MARGIN is required from the second frame on,
+- a track still undecided after VOTE_WINDOW frames is rejected as unknown.
+"""
+import threading
+import time
+
+import numpy as np
+
+from Backend.FaceRecognition.GalleryIndex import ENCODING_DIM
+
+VOTE_WINDOW = 5
+VOTE_EARLY_MARGIN = 0.2
+VOTE_MIN_MARGIN = 0.1
+# Votes of tracks not updated for this long are dropped
+VOTE_TTL = 2.0
+
+PENDING = "pending"
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+
+
+class _Votes:
+    __slots__ = ("total", "count", "last_seen")
+
+    def __init__(self, now):
+        self.total = np.zeros(ENCODING_DIM, dtype=np.float64)
+        self.count = 0
+        self.last_seen = now
+
+
+class TrackVoter:
+    """Accumulates encodings per track id and decides when confident (thread-safe)"""
+
+    def __init__(self, gallery, student_class=None, window=VOTE_WINDOW, early_margin=VOTE_EARLY_MARGIN,
+                 min_margin=VOTE_MIN_MARGIN, tolerance=None, ttl=VOTE_TTL):
+        self.gallery = gallery
+        self.student_class = student_class
+        self.window = window
+        self.early_margin = early_margin
+        self.min_margin = min_margin
+        self.tolerance = gallery.tolerance if tolerance is None else tolerance
+        self.ttl = ttl
+        self.votes = {}
+        self.lock = threading.Lock()
+
+    def add(self, track_id, encoding, now=None):
+        """Add one frame's encoding, returns (status, student_id, distance).
+
+        status is ACCEPTED (with the student), REJECTED (unknown or ambiguous
+        face) or PENDING (more frames needed). The track's votes are reset
+        once decided.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            votes = self.votes.get(track_id)
+            if votes is None:
+                votes = self.votes[track_id] = _Votes(now)
+            votes.total += encoding
+            votes.count += 1
+            votes.last_seen = now
+            mean, count = votes.total / votes.count, votes.count
+
+        best, second = self.gallery.query_margin(mean, self.tolerance, self.student_class)[0]
+        status = PENDING
+        if best is not None and best[1] <= self.tolerance:
+            margin = second[1] - best[1] if second is not None else float("inf")
+            if margin >= (self.early_margin if count == 1 else self.min_margin):
+                status = ACCEPTED
+        if status == PENDING and count >= self.window:
+            status = REJECTED
+
+        if status != PENDING:
+            with self.lock:
+                self.votes.pop(track_id, None)
+        if status == ACCEPTED:
+            return status, best[0], best[1]
+        return status, None, None
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            stale = [i for i, votes in self.votes.items() if now - votes.last_seen > self.ttl]
+            for track_id in stale:
+                del self.votes[track_id]
+        return len(stale)
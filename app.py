@@ -1,5 +1,4 @@
 import json
-import sqlite3
 import subprocess
 import sys
 import os
@@ -9,17 +8,20 @@ from flask import Flask, render_template, jsonify, request, redirect, url_for, s
 from flask_cors import CORS
 from Backend.FaceRecognition.FaceMain import run_face_attendance
 from Backend.Database.NewDataFile import check_database_status
+from Backend.Database.DataAccess import get_db, init_app
+from Backend.Database.AttendanceStats import (class_attendance_rate, class_day, present_days, present_on,
+                                              student_summary)
 from translations import translations
 
 app = Flask(__name__)
 CORS(app)
+# Applies pending migrations; pooled SQLite connection per request, returned to the pool at teardown
+init_app(app)
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 🔑 Required for session
 app.secret_key = "supersecretkey123"
 
-db_path = "Backend/Database/school_portal.db"
-
 def get_text(key, lang='en'):
     return translations.get(lang, {}).get(key, translations['en'].get(key, key))
 
@@ -36,27 +38,24 @@ def set_language(lang):
 
 
 def verify_user(table, user_id, password, role):
-    try:
-        if role == "student":
-            id = "StudentID"
-        elif role == "teacher":
-            id = "TeacherID"
-        else:
-            id = "AdminID"
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+    if role == "student":
+        id = "StudentID"
+    elif role == "teacher":
+        id = "TeacherID"
+    else:
+        id = "AdminID"
+    conn = get_db()
+    cursor = conn.cursor()
 
-        cursor.execute(f"SELECT Password FROM {table} WHERE {id} = ?", (user_id,))
-        row = cursor.fetchone()
+    cursor.execute(f"SELECT Password FROM {table} WHERE {id} = ?", (user_id,))
+    row = cursor.fetchone()
 
-        if row:
-            stored_password = row[0]
-            # ⚠️ In production, store hashed passwords and use check_password_hash
-            if stored_password == password:
-                return True
-        return False
-    finally:
-        conn.close()
+    if row:
+        stored_password = row[0]
+        # ⚠️ In production, store hashed passwords and use check_password_hash
+        if stored_password == password:
+            return True
+    return False
 
 
 @app.route("/")
@@ -119,11 +118,10 @@ def teacher():
     teacher_data = None
 
     # Fetch teacher details from DB
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Name, TeacherID, Class FROM ClassTeachers WHERE TeacherID = ?", (user_id,))
     row = cursor.fetchone()
-    conn.close()
 
     if row:
         teacher_data = {
@@ -141,11 +139,10 @@ def admin():
     user_id = session.get("user_id")
 
     # Fetch admin details including school
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Name, School FROM Admin WHERE AdminID = ?", (user_id,))
     row = cursor.fetchone()
-    conn.close()
     if row:
         admin_data = {
             "name": row[0],
@@ -182,11 +179,10 @@ def student():
     user_id = session.get("user_id")
 
     # Fetch student details from DB
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Name, StudentID, Class, RollNumber FROM Students WHERE StudentID = ?", (user_id,))
     row = cursor.fetchone()
-    conn.close()
 
     if row:
         student_data = {
@@ -221,11 +217,10 @@ def newUser():
     user_id = session.get("user_id")
 
     # Fetch teacher details from DB
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Class FROM ClassTeachers WHERE TeacherID = ?", (user_id,))
     row = cursor.fetchone()
-    conn.close()
     if row:
         teacher_data = {
             "class": row[0]
@@ -240,19 +235,18 @@ def mark_attendance_api():
     
     # Get teacher's class
     teacher_id = session.get("user_id")
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Class FROM ClassTeachers WHERE TeacherID = ?", (teacher_id,))
     teacher_class = cursor.fetchone()[0]
     
-    student = run_face_attendance()
+    student = run_face_attendance(student_class=teacher_class)
     if student:
         # Validate student belongs to teacher's class
-        cursor.execute("SELECT Class FROM Students WHERE StudentID = ?", (student['StudentID'],))
+        cursor.execute("SELECT Class FROM Students WHERE StudentID = ?", (student['id'],))
         student_class_result = cursor.fetchone()
         
         if not student_class_result:
-            conn.close()
             return jsonify({
                 'status': 'fail',
                 'message': "Student not found in database"
@@ -261,18 +255,15 @@ def mark_attendance_api():
         student_class = student_class_result[0]
         
         if student_class != teacher_class:
-            conn.close()
             return jsonify({
                 'status': 'fail', 
-                'message': f"Access denied: {student['Name']} belongs to class {student_class}, but you teach class {teacher_class}"
+                'message': f"Access denied: {student['name']} belongs to class {student_class}, but you teach class {teacher_class}"
             }), 403
         
-        conn.close()
         # Store student data in session for success page
         session['attendance_student'] = student
         return redirect(url_for('attendance_success'))
     else:
-        conn.close()
         return jsonify({
             'status': 'fail',
             'message': "No student recognized"
@@ -309,12 +300,11 @@ def analysis(StuID):
     from PIL import Image, ImageDraw, ImageFont
     from datetime import datetime
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get attendance data
-    cursor.execute("SELECT COUNT(*) FROM Attendance WHERE StudentID = ? AND Status = 'Present'", (StuID,))
-    present = cursor.fetchone()[0] or 0
+    present = present_days(conn, StuID)
     
     cursor.execute("SELECT MAX(DayID) FROM SchoolDays")
     total = cursor.fetchone()[0] or 0
@@ -322,8 +312,6 @@ def analysis(StuID):
     cursor.execute("SELECT Name, Class FROM Students WHERE StudentID = ?", (StuID,))
     student_info = cursor.fetchone()
     
-    conn.close()
-    
     # Create professional report
     img = Image.new('RGB', (1000, 700), color='#ffffff')
     draw = ImageDraw.Draw(img)
@@ -416,15 +404,11 @@ def attendance_analysis():
         return redirect(url_for('student'))
     
     # Get attendance data for charts
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get present days
-    cursor.execute("""
-        SELECT COUNT(Date) FROM Attendance
-        WHERE StudentID = ? AND Status = 'Present'
-    """, (StuID,))
-    present = cursor.fetchone()[0] or 0
+    present = present_days(conn, StuID)
     
     # Get total school days
     cursor.execute("SELECT MAX(DayID) FROM SchoolDays")
@@ -434,8 +418,6 @@ def attendance_analysis():
     cursor.execute("SELECT Name, Class FROM Students WHERE StudentID = ?", (StuID,))
     student_info = cursor.fetchone()
     
-    conn.close()
-    
     absent = total - present
     percentage = (present / total * 100) if total > 0 else 0
     
@@ -483,7 +465,7 @@ def download_report():
         return jsonify({"error": "Failed to generate report"}), 500
 
 def attend_percentage(StudentID):
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     c = conn.cursor()
 
     total = c.execute("""
@@ -491,17 +473,11 @@ def attend_percentage(StudentID):
     """).fetchone()[0]
 
     if not total or total == 0:
-        conn.close()
         return 0
 
-    present_days = c.execute("""
-        SELECT COUNT(Date) FROM Attendance
-        WHERE StudentID = ? AND Status = ?
-    """, (StudentID, "Present")).fetchone()[0]
-
-    conn.close()
+    present = present_days(conn, StudentID)
 
-    return (present_days / total) * 100
+    return (present / total) * 100
 
 @app.route('/attendance_percentage', methods=['GET'])
 def get_attendance_percentage():
@@ -554,11 +530,10 @@ def check_class_teacher():
     if not admin_school:
         return jsonify({"error": "School not found"}), 400
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM ClassTeachers WHERE Class = ? AND (School = ? OR School IS NULL)", (class_name, admin_school,))
     count = cursor.fetchone()[0]
-    conn.close()
     
     return jsonify({"exists": count > 0})
 
@@ -571,11 +546,10 @@ def check_teacher_email():
     if not email:
         return jsonify({"error": "Email parameter required"}), 400
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM ClassTeachers WHERE Email = ?", (email,))
     count = cursor.fetchone()[0]
-    conn.close()
     
     return jsonify({"exists": count > 0})
 
@@ -588,11 +562,10 @@ def check_teacher_phone():
     if not phone:
         return jsonify({"error": "Phone parameter required"}), 400
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM ClassTeachers WHERE Phone = ?", (phone,))
     count = cursor.fetchone()[0]
-    conn.close()
     
     return jsonify({"exists": count > 0})
 
@@ -602,7 +575,7 @@ def validate_teacher():
         return jsonify({"error": "Unauthorized"}), 401
     
     data = request.get_json()
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     conflicts = {}
@@ -621,7 +594,6 @@ def validate_teacher():
         if cursor.fetchone()[0] > 0:
             conflicts['phone'] = 'Phone already registered'
     
-    conn.close()
     return jsonify({"valid": len(conflicts) == 0, "conflicts": conflicts})
 
 @app.route('/teacher-records')
@@ -633,7 +605,7 @@ def teacher_records():
     if not admin_school:
         return redirect(url_for("admin"))
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT TeacherID, Name, Email, Phone, Gender, DOB, Class, Password 
@@ -642,33 +614,32 @@ def teacher_records():
         ORDER BY Name
     """, (admin_school,))
     teachers = cursor.fetchall()
-    conn.close()
     
     return render_template("teacher_records.html", teachers=teachers)
 
 def ratio(StuID):
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     c = conn.cursor()
 
-    present = c.execute("""
-        SELECT COUNT(Date) FROM Attendance
-        WHERE StudentID = ? AND Status = 'Present'
-    """, (StuID,)).fetchone()[0]
+    present = present_days(conn, StuID)
 
     total = c.execute("""
         SELECT MAX(DayID) FROM SchoolDays
     """).fetchone()[0]
 
-    conn.close()
     return total, present
 
 @app.route('/api/attendance/<int:StuID>')
 def api_attendance(StuID):
     total, present = ratio(StuID)
+    summary = student_summary(get_db(), StuID)
     return jsonify({
         "StudentID": StuID,
         "TotalDays": total,
-        "PresentDays": present
+        "PresentDays": present,
+        "LastPresentDate": summary["last_present_date"],
+        "CurrentStreak": summary["current_streak"],
+        "LongestStreak": summary["longest_streak"]
     })
 
 @app.route('/attendance/<int:StuID>')
@@ -684,27 +655,26 @@ def analytics():
     user_id = session.get("user_id")
     
     # Get teacher's class
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Class FROM ClassTeachers WHERE TeacherID = ?", (user_id,))
     teacher_class = cursor.fetchone()[0]
     
+    cursor.execute("SELECT MAX(DayID) FROM SchoolDays")
+    total_school = cursor.fetchone()[0] or 0
+    
     # Get all students in teacher's class with attendance data
     cursor.execute("""
-        SELECT s.StudentID, s.Name, s.RollNumber,
-               COUNT(CASE WHEN a.Status = 'Present' THEN 1 END) as present_days,
-               COUNT(a.AttendanceID) as total_marked_days,
-               (SELECT MAX(DayID) FROM SchoolDays) as total_school_days
+        SELECT s.StudentID, s.Name, s.RollNumber, COALESCE(summary.PresentDays, 0)
         FROM Students s
-        LEFT JOIN Attendance a ON s.StudentID = a.StudentID
+        LEFT JOIN StudentAttendanceSummary summary ON s.StudentID = summary.StudentID
         WHERE s.Class = ?
-        GROUP BY s.StudentID, s.Name, s.RollNumber
         ORDER BY s.RollNumber
     """, (teacher_class,))
     
     students_data = []
     for row in cursor.fetchall():
-        student_id, name, roll, present, marked, total_school = row
+        student_id, name, roll, present = row
         percentage = (present / total_school * 100) if total_school > 0 else 0
         students_data.append({
             'id': student_id,
@@ -715,8 +685,6 @@ def analytics():
             'percentage': round(percentage, 1)
         })
     
-    conn.close()
-    
     return render_template("analytics.html", 
                          students=students_data, 
                          teacher_class=teacher_class)
@@ -727,7 +695,7 @@ def teacher_analytics():
         return redirect(url_for("first"))
     
     user_id = session.get("user_id")
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get teacher info
@@ -743,34 +711,17 @@ def teacher_analytics():
     total_days = cursor.fetchone()[0] or 0
     
     # Get today's attendance
-    from datetime import date
-    today = date.today().strftime('%Y-%m-%d')
-    cursor.execute("""
-        SELECT COUNT(*) FROM Attendance a
-        JOIN Students s ON a.StudentID = s.StudentID
-        WHERE s.Class = ? AND a.Date = ? AND a.Status = 'Present'
-    """, (teacher_class, today))
-    present_today = cursor.fetchone()[0] or 0
-    
-    # Calculate overall class attendance rate
-    cursor.execute("""
-        SELECT COUNT(CASE WHEN a.Status = 'Present' THEN 1 END) as total_present,
-               COUNT(*) as total_records
-        FROM Attendance a
-        JOIN Students s ON a.StudentID = s.StudentID
-        WHERE s.Class = ?
-    """, (teacher_class,))
-    attendance_stats = cursor.fetchone()
-    class_attendance_rate = (attendance_stats[0] / attendance_stats[1] * 100) if attendance_stats[1] > 0 else 0
+    present_today, _ = class_day(conn, teacher_class)
     
-    conn.close()
+    # Calculate overall class attendance rate (present over enrolled, all school days)
+    attendance_rate = class_attendance_rate(conn, teacher_class)
     
     chart_data = {
         'total_students': total_students,
         'present_today': present_today,
         'absent_today': total_students - present_today,
         'total_days': total_days,
-        'class_attendance_rate': round(class_attendance_rate, 1),
+        'class_attendance_rate': round(attendance_rate, 1),
         'teacher_name': teacher_info[0],
         'teacher_class': teacher_class,
         'teacher_id': user_id
@@ -785,7 +736,7 @@ def teacher_student_analytics(student_id):
     
     # Verify student belongs to teacher's class
     teacher_id = session.get("user_id")
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute("SELECT Class FROM ClassTeachers WHERE TeacherID = ?", (teacher_id,))
@@ -795,18 +746,14 @@ def teacher_student_analytics(student_id):
     student_info = cursor.fetchone()
     
     if not student_info or student_info[0] != teacher_class:
-        conn.close()
         return redirect(url_for('analytics'))
     
     # Get attendance data for charts
-    cursor.execute("SELECT COUNT(*) FROM Attendance WHERE StudentID = ? AND Status = 'Present'", (student_id,))
-    present = cursor.fetchone()[0] or 0
+    present = present_days(conn, student_id)
     
     cursor.execute("SELECT MAX(DayID) FROM SchoolDays")
     total = cursor.fetchone()[0] or 0
     
-    conn.close()
-    
     absent = total - present
     percentage = (present / total * 100) if total > 0 else 0
     
@@ -828,11 +775,10 @@ def profile():
         return redirect(url_for("first"))
     
     user_id = session.get("user_id")
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Name, StudentID, Class, RollNumber, Phone FROM Students WHERE StudentID = ?", (user_id,))
     row = cursor.fetchone()
-    conn.close()
     
     if row:
         student_data = {
@@ -856,7 +802,7 @@ def update_profile():
         return jsonify({"status": "error", "message": "Password is required"}), 400
     
     try:
-        conn = sqlite3.connect(db_path)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Only update password for students
@@ -867,7 +813,6 @@ def update_profile():
         """, (password, user_id))
         
         conn.commit()
-        conn.close()
         
         return jsonify({"status": "success", "message": "Password updated successfully!"})
     except Exception as e:
@@ -879,11 +824,10 @@ def teacher_profile():
         return redirect(url_for("first"))
     
     user_id = session.get("user_id")
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT Name, TeacherID, Class, Email, Phone FROM ClassTeachers WHERE TeacherID = ?", (user_id,))
     row = cursor.fetchone()
-    conn.close()
     
     if row:
         teacher_data = {
@@ -907,7 +851,7 @@ def update_teacher_profile():
         return jsonify({"status": "error", "message": "Password is required"}), 400
     
     try:
-        conn = sqlite3.connect(db_path)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -917,7 +861,6 @@ def update_teacher_profile():
         """, (password, user_id))
         
         conn.commit()
-        conn.close()
         
         return jsonify({"status": "success", "message": "Password updated successfully!"})
     except Exception as e:
@@ -930,39 +873,36 @@ def admin_analytics():
     
     selected_class = request.args.get('class', 'all')
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get all available classes
     cursor.execute("SELECT DISTINCT Class FROM Students ORDER BY Class")
     all_classes = [row[0] for row in cursor.fetchall()]
     
-    # Get students based on selected class
+    cursor.execute("SELECT MAX(DayID) FROM SchoolDays")
+    total_school = cursor.fetchone()[0] or 0
+    
+    # Get students based on selected class, present days from the per-student summary
     if selected_class == 'all':
         cursor.execute("""
-            SELECT s.StudentID, s.Name, s.Class, s.RollNumber,
-                   COUNT(CASE WHEN a.Status = 'Present' THEN 1 END) as present_days,
-                   (SELECT MAX(DayID) FROM SchoolDays) as total_school_days
+            SELECT s.StudentID, s.Name, s.Class, s.RollNumber, COALESCE(summary.PresentDays, 0)
             FROM Students s
-            LEFT JOIN Attendance a ON s.StudentID = a.StudentID
-            GROUP BY s.StudentID, s.Name, s.Class, s.RollNumber
+            LEFT JOIN StudentAttendanceSummary summary ON s.StudentID = summary.StudentID
             ORDER BY s.Class, s.RollNumber
         """)
     else:
         cursor.execute("""
-            SELECT s.StudentID, s.Name, s.Class, s.RollNumber,
-                   COUNT(CASE WHEN a.Status = 'Present' THEN 1 END) as present_days,
-                   (SELECT MAX(DayID) FROM SchoolDays) as total_school_days
+            SELECT s.StudentID, s.Name, s.Class, s.RollNumber, COALESCE(summary.PresentDays, 0)
             FROM Students s
-            LEFT JOIN Attendance a ON s.StudentID = a.StudentID
+            LEFT JOIN StudentAttendanceSummary summary ON s.StudentID = summary.StudentID
             WHERE s.Class = ?
-            GROUP BY s.StudentID, s.Name, s.Class, s.RollNumber
             ORDER BY s.RollNumber
         """, (selected_class,))
     
     students_data = []
     for row in cursor.fetchall():
-        student_id, name, class_name, roll, present, total_school = row
+        student_id, name, class_name, roll, present = row
         percentage = (present / total_school * 100) if total_school > 0 else 0
         students_data.append({
             'id': student_id,
@@ -974,8 +914,6 @@ def admin_analytics():
             'percentage': round(percentage, 1)
         })
     
-    conn.close()
-    
     return render_template("admin_analytics.html", 
                          students=students_data, 
                          all_classes=all_classes,
@@ -986,7 +924,7 @@ def government_reports():
     if not session.get("logged_in") or session.get("role") != "admin":
         return redirect(url_for("first"))
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get total students
@@ -1006,17 +944,11 @@ def government_reports():
     from datetime import date
     today = date.today().strftime('%Y-%m-%d')
     
-    cursor.execute("""
-        SELECT COUNT(*) FROM Attendance 
-        WHERE Date = ? AND Status = 'Present'
-    """, (today,))
-    present_today = cursor.fetchone()[0]
+    present_today = present_on(conn, today)
     
     # Calculate meal requirements (assuming 1 meal per present student)
     meals_required = present_today
     
-    conn.close()
-    
     return render_template("government_reports.html", 
                          total_students=total_students,
                          class_breakdown=class_breakdown,
@@ -1033,7 +965,7 @@ def download_government_report():
     from PIL import Image, ImageDraw, ImageFont
     from datetime import datetime
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get report data
@@ -1044,10 +976,7 @@ def download_government_report():
     class_breakdown = cursor.fetchall()
     
     today = datetime.now().strftime('%Y-%m-%d')
-    cursor.execute("SELECT COUNT(*) FROM Attendance WHERE Date = ? AND Status = 'Present'", (today,))
-    present_today = cursor.fetchone()[0]
-    
-    conn.close()
+    present_today = present_on(conn, today)
     
     # Create beautiful government report
     img = Image.new('RGB', (1400, 1000), color='#f8f9fa')
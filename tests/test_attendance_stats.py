@@ -0,0 +1,139 @@
+"""Counters kept by the attendance triggers, compared with a full recount"""
+import sqlite3
+
+import pytest
+
+from Backend.Database.AttendanceStats import (class_attendance_rate, class_day, present_on, rebuild_class_daily,
+                                              rebuild_student_summary, student_summary)
+from Backend.Database.NewDataFile import create_db
+
+DAYS = ["2026-01-05", "2026-01-06", "2026-01-07", "2026-01-08"]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Migrated database with students 1-3 in 5A, 4 in 6B and the school days in DAYS"""
+    database = str(tmp_path / "school.db")
+    create_db(database)
+    conn = sqlite3.connect(database)
+    for student_id, student_class in [(1, "5A"), (2, "5A"), (3, "5A"), (4, "6B")]:
+        add_student(conn, student_id, student_class)
+    conn.executemany("INSERT INTO SchoolDays (Date) VALUES (?)", [(day,) for day in DAYS])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def add_student(conn, student_id, student_class):
+    conn.execute("""
+        INSERT INTO Students (StudentID, Name, RollNumber, Class, Gender, Teacher, Password)
+        VALUES (?, ?, ?, ?, 'F', 'teacher', 'secret')
+    """, (student_id, f"student {student_id}", student_id, student_class))
+
+
+def mark(conn, student_id, day, status="Present"):
+    student_class = conn.execute("SELECT Class FROM Students WHERE StudentID = ?", (student_id,)).fetchone()[0]
+    conn.execute("INSERT INTO Attendance (StudentID, Date, Status, Class) VALUES (?, ?, ?, ?)",
+                 (student_id, day, status, student_class))
+
+
+def summary(conn, student_id):
+    return conn.execute("""
+        SELECT PresentDays, LastPresentDate, CurrentStreak, LongestStreak
+        FROM StudentAttendanceSummary WHERE StudentID = ?
+    """, (student_id,)).fetchone()
+
+
+def assert_matches_recount(conn):
+    summaries = conn.execute("SELECT * FROM StudentAttendanceSummary WHERE PresentDays > 0 ORDER BY StudentID").fetchall()
+    daily = conn.execute("SELECT * FROM ClassDailyAttendance ORDER BY Class, Date").fetchall()
+    totals = conn.execute("SELECT * FROM ClassAttendanceTotals ORDER BY Class").fetchall()
+
+    cursor = conn.cursor()
+    cursor.execute("SAVEPOINT recount")
+    rebuild_student_summary(cursor)
+    rebuild_class_daily(cursor)
+    assert summaries == conn.execute("SELECT * FROM StudentAttendanceSummary ORDER BY StudentID").fetchall()
+    assert daily == conn.execute("SELECT * FROM ClassDailyAttendance ORDER BY Class, Date").fetchall()
+    assert totals == conn.execute("""
+        SELECT Class, SUM(Present), SUM(Enrolled) FROM ClassDailyAttendance GROUP BY Class ORDER BY Class
+    """).fetchall()
+    cursor.execute("ROLLBACK TO recount")
+    cursor.execute("RELEASE recount")
+
+
+def test_insert(conn):
+    for day in DAYS[:3]:
+        mark(conn, 1, day)
+    mark(conn, 2, DAYS[2])
+    mark(conn, 4, DAYS[2], "Absent")
+
+    assert summary(conn, 1) == (3, DAYS[2], 3, 3)
+    assert summary(conn, 4) is None
+    assert class_day(conn, "5A", DAYS[2]) == (2, 3)
+    assert class_day(conn, "6B", DAYS[2]) == (0, 1)
+    assert present_on(conn, DAYS[2]) == 2
+    assert class_attendance_rate(conn, "5A") == pytest.approx(4 / 12 * 100)
+    assert student_summary(conn, 1, today=DAYS[3])["current_streak"] == 3
+    assert_matches_recount(conn)
+
+
+def test_delete_recomputes_streaks(conn):
+    for day in DAYS:
+        mark(conn, 1, day)
+    conn.execute("DELETE FROM Attendance WHERE StudentID = 1 AND Date = ?", (DAYS[1],))
+
+    assert summary(conn, 1) == (3, DAYS[3], 2, 2)
+    assert class_day(conn, "5A", DAYS[1]) == (0, 3)
+    assert_matches_recount(conn)
+
+    conn.execute("DELETE FROM Attendance WHERE StudentID = 1")
+    assert summary(conn, 1) == (0, None, 0, 0)
+    assert class_attendance_rate(conn, "5A") == 0
+    assert_matches_recount(conn)
+
+
+def test_status_update(conn):
+    for day in DAYS[:3]:
+        mark(conn, 1, day)
+    mark(conn, 2, DAYS[1], "Absent")
+
+    conn.execute("UPDATE Attendance SET Status = 'Absent' WHERE StudentID = 1 AND Date = ?", (DAYS[2],))
+    assert summary(conn, 1) == (2, DAYS[1], 2, 2)
+    assert class_day(conn, "5A", DAYS[2]) == (0, 3)
+
+    conn.execute("UPDATE Attendance SET Status = 'Present' WHERE StudentID = 2")
+    assert summary(conn, 2) == (1, DAYS[1], 1, 1)
+    assert class_day(conn, "5A", DAYS[1]) == (2, 3)
+    assert_matches_recount(conn)
+
+
+def test_mark_moved_to_another_day_and_class(conn):
+    mark(conn, 1, DAYS[0])
+    mark(conn, 1, DAYS[2])
+    conn.execute("UPDATE OR IGNORE Attendance SET Date = ?, Class = '6B' WHERE Date = ?", (DAYS[1], DAYS[2]))
+
+    assert summary(conn, 1) == (2, DAYS[1], 2, 2)
+    assert class_day(conn, "5A", DAYS[2]) == (0, 3)
+    assert class_day(conn, "6B", DAYS[1]) == (1, 1)
+    assert_matches_recount(conn)
+
+
+def test_backdated_insert_joins_streaks(conn):
+    mark(conn, 1, DAYS[0])
+    mark(conn, 1, DAYS[2])
+    mark(conn, 1, DAYS[3])
+    assert summary(conn, 1) == (3, DAYS[3], 2, 2)
+
+    mark(conn, 1, DAYS[1])
+    assert summary(conn, 1) == (4, DAYS[3], 4, 4)
+    assert_matches_recount(conn)
+
+
+def test_enrolled_is_fixed_when_the_day_starts(conn):
+    conn.execute("INSERT INTO SchoolDays (Date) VALUES ('2026-01-09')")
+    add_student(conn, 5, "5A")
+    mark(conn, 5, "2026-01-09")
+
+    assert class_day(conn, "5A", "2026-01-09") == (1, 3)
+    assert conn.execute("SELECT Enrolled FROM ClassAttendanceTotals WHERE Class = '5A'").fetchone() == (15,)
@@ -0,0 +1,48 @@
+"""Background attendance writer: flushing on close and reporting what was not written"""
+import threading
+
+from Backend.FaceRecognition.AttendanceWriter import AttendanceWriter
+
+
+def test_close_flushes_queued_marks():
+    written = []
+    # A long flush interval: nothing is written before close()
+    writer = AttendanceWriter(lambda student_ids, day: written.extend(student_ids), flush_interval=60)
+    for student_id in [1, 2, 3, 2]:
+        writer.submit(student_id, day="2026-01-05")
+
+    assert writer.close() == 0
+    assert sorted(written) == [1, 2, 3]
+    assert writer.duplicates == 1
+    assert not writer.thread.is_alive()
+
+
+def test_already_marked_students_are_not_queued():
+    writer = AttendanceWriter(lambda student_ids, day: None, load_marked=lambda day: [7])
+    assert writer.is_marked(7)
+    assert not writer.submit(7)
+    assert writer.close() == 0
+
+
+def test_close_reports_marks_left_when_the_writer_is_stuck():
+    release = threading.Event()
+    writer = AttendanceWriter(lambda student_ids, day: release.wait(), flush_interval=0.01)
+    for student_id in [1, 2, 3]:
+        writer.submit(student_id, day="2026-01-05")
+    try:
+        assert writer.close(timeout=0.2) == 3
+    finally:
+        release.set()
+    writer.thread.join(5)
+    assert writer.written == 3
+
+
+def test_close_reports_marks_that_kept_failing():
+    def fail(student_ids, day):
+        raise RuntimeError("database is locked")
+
+    # Retries wait for the flush interval or close(), so the writer gives up while stopping
+    writer = AttendanceWriter(fail, flush_interval=60)
+    writer.submit(1, day="2026-01-05")
+    assert writer.close() == 1
+    assert not writer.is_marked(1, day="2026-01-05")  # a later recognition may try again
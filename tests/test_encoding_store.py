@@ -0,0 +1,83 @@
+"""Encoding blobs and the gallery file: compact formats, legacy rows and round-trips"""
+import pickle
+
+import numpy as np
+import pytest
+
+from Backend.FaceRecognition.EncodingStore import (FORMATS, decode_blobs, decode_rows, encode_blob, read_gallery_file,
+                                                   write_gallery_file)
+from Backend.FaceRecognition.GalleryIndex import ENCODING_DIM
+
+
+@pytest.fixture
+def encodings():
+    return np.random.default_rng(0).normal(scale=0.1, size=(4, ENCODING_DIM))
+
+
+@pytest.mark.parametrize("dtype", sorted(FORMATS))
+def test_blob_round_trip(encodings, dtype):
+    blobs = [encode_blob(encoding, dtype) for encoding in encodings]
+    assert {len(blob) for blob in blobs} == {1 + ENCODING_DIM * FORMATS[dtype][1].itemsize}
+
+    matrix, valid = decode_blobs(blobs)
+    assert matrix.dtype == np.float32 and valid.all()
+    assert matrix == pytest.approx(encodings, abs=1e-3 if dtype == "float16" else 1e-6)
+
+
+def test_legacy_and_broken_rows(encodings):
+    blobs = [
+        encode_blob(encodings[0]),
+        encodings[1].astype(np.float64).tobytes(),  # raw float64, before the header byte
+        pickle.dumps(encodings[2]),
+        b"\x07not an encoding",
+        encode_blob(encodings[3], "float16"),
+    ]
+    matrix, valid = decode_blobs(blobs)
+    assert valid.tolist() == [True, True, True, False, True]
+    assert matrix[:3] == pytest.approx(encodings[:3], abs=1e-6)
+    assert not matrix[3].any()
+
+
+def test_decode_rows_skips_unreadable_blobs(encodings):
+    matrix, student_ids = decode_rows([(1, encode_blob(encodings[0])), (2, b""), (3, encode_blob(encodings[1]))])
+    assert student_ids.tolist() == [1, 3]
+    assert matrix == pytest.approx(encodings[:2], abs=1e-6)
+    assert decode_rows([])[0].shape == (0, ENCODING_DIM)
+
+
+@pytest.mark.parametrize("dtype", sorted(FORMATS))
+def test_gallery_file_round_trip(tmp_path, encodings, dtype):
+    path = str(tmp_path / "gallery.fgal")
+    classes = ["5A", None, "6B", "Größe 7"]
+    write_gallery_file(path, encodings, [4, 8, 15, 16], classes, dtype)
+
+    # chunk_rows=3 makes the matrix span several read chunks
+    matrix, student_ids, student_classes = read_gallery_file(path, chunk_rows=3)
+    assert matrix.dtype == np.float32
+    assert matrix == pytest.approx(encodings, abs=1e-3 if dtype == "float16" else 1e-6)
+    assert student_ids.tolist() == [4, 8, 15, 16]
+    assert student_classes == classes
+
+
+def test_empty_gallery_file(tmp_path):
+    path = str(tmp_path / "gallery.fgal")
+    write_gallery_file(path, np.zeros((0, ENCODING_DIM)), [], [])
+    matrix, student_ids, student_classes = read_gallery_file(path)
+    assert matrix.shape == (0, ENCODING_DIM) and len(student_ids) == 0 and student_classes == []
+
+
+@pytest.mark.parametrize("damage", ["truncate", "flip", "magic"])
+def test_damaged_gallery_file_is_rejected(tmp_path, encodings, damage):
+    path = tmp_path / "gallery.fgal"
+    write_gallery_file(str(path), encodings, [1, 2, 3, 4], ["5A"] * 4)
+    data = bytearray(path.read_bytes())
+    if damage == "truncate":
+        data = data[:-10]
+    elif damage == "flip":
+        data[100] ^= 0xFF
+    else:
+        data[:4] = b"PKL!"
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError):
+        read_gallery_file(str(path))
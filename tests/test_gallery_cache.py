@@ -0,0 +1,151 @@
+"""Gallery cache refreshed from the face_encodings change log and shared as a snapshot"""
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from Backend.Database.DataAccess import get_pool
+from Backend.Database.NewDataFile import create_db
+from Backend.FaceRecognition.EncodingStore import encode_blob
+from Backend.FaceRecognition.GalleryCache import GalleryCache
+from Backend.FaceRecognition.GalleryIndex import ENCODING_DIM
+
+rng = np.random.default_rng(0)
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Migrated database with students 1-4 (1-2 in 5A, 3-4 in 6B), each with an encoding"""
+    database = str(tmp_path / "school.db")
+    create_db(database)
+    conn = sqlite3.connect(database)
+    for student_id in range(1, 5):
+        conn.execute("""
+            INSERT INTO Students (StudentID, Name, RollNumber, Class, Gender, Teacher, Password)
+            VALUES (?, ?, ?, ?, 'F', 'teacher', 'secret')
+        """, (student_id, f"student {student_id}", student_id, "5A" if student_id <= 2 else "6B"))
+        set_encoding(conn, student_id)
+    conn.commit()
+    conn.close()
+    return database
+
+
+def set_encoding(conn, student_id):
+    encoding = rng.normal(scale=0.1, size=ENCODING_DIM)
+    conn.execute("INSERT OR REPLACE INTO face_encodings (id, encoding) VALUES (?, ?)",
+                 (student_id, encode_blob(encoding)))
+    return encoding
+
+
+def contents(cache):
+    """{student id: (class, encoding)} of everything the cache holds"""
+    classes = cache._row_classes()
+    return {int(i): (c, e) for i, c, e in zip(cache.student_ids, classes, cache.encodings)}
+
+
+def expected_contents(database):
+    conn = sqlite3.connect(database)
+    cache = GalleryCache(database, None)
+    cache._full_load(conn.cursor())
+    conn.close()
+    return contents(cache)
+
+
+def assert_current(cache, database):
+    found, expected = contents(cache), expected_contents(database)
+    assert {i: c for i, (c, _) in found.items()} == {i: c for i, (c, _) in expected.items()}
+    for student_id, (_, encoding) in expected.items():
+        assert np.array_equal(found[student_id][1], encoding)
+
+
+def test_refresh_applies_logged_changes(database, tmp_path):
+    cache = GalleryCache(database, str(tmp_path / "snapshot"))
+    assert cache.refresh(export=False)
+    assert_current(cache, database)
+    assert not cache.refresh(export=False)
+
+    conn = sqlite3.connect(database)
+    new_encoding = set_encoding(conn, 2)
+    conn.execute("DELETE FROM face_encodings WHERE id = 4")
+    conn.execute("UPDATE Students SET Class = '6B' WHERE StudentID = 1")
+    conn.commit()
+
+    assert cache.refresh(export=False)
+    assert_current(cache, database)
+    assert np.array_equal(contents(cache)[2][1], new_encoding.astype(np.float32))
+    assert sorted(contents(cache)) == [1, 2, 3]
+
+    # A student deleted from Students stays in the gallery without a class
+    conn.execute("DELETE FROM Students WHERE StudentID = 3")
+    conn.commit()
+    conn.close()
+    assert cache.refresh(export=False)
+    assert contents(cache)[3][0] is None
+    assert_current(cache, database)
+
+
+def log_size(database):
+    conn = sqlite3.connect(database)
+    count = conn.execute("SELECT COUNT(*) FROM face_encodings_log").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_snapshot_is_shared_and_compacts_the_log(database, tmp_path):
+    snapshot_dir = str(tmp_path / "snapshot")
+    first = GalleryCache(database, snapshot_dir)
+    assert first.refresh()
+    assert first.class_ranges == {"5A": [0, 2], "6B": [2, 4]}
+    assert log_size(database) == 0
+    assert_current(first, database)
+
+    # Another process starts from the snapshot
+    second = GalleryCache(database, snapshot_dir)
+    assert second.refresh()
+    assert second.watermark == first.watermark
+    assert_current(second, database)
+
+    conn = sqlite3.connect(database)
+    conn.execute("UPDATE Students SET Class = '6B' WHERE StudentID = 2")
+    conn.commit()
+    conn.close()
+    assert first.refresh()
+    assert first.class_ranges == {"5A": [0, 1], "6B": [1, 4]}
+    assert log_size(database) == 0
+
+    # The log rows second missed are gone, it maps the newer snapshot instead
+    assert second.refresh()
+    assert second.class_ranges == first.class_ranges
+    assert_current(second, database)
+
+
+def test_read_only_refresh_writes_nothing(database, tmp_path):
+    snapshot_dir = str(tmp_path / "snapshot")
+    logged = log_size(database)
+    cache = GalleryCache(database, snapshot_dir)
+    assert cache.refresh(export=False)
+    assert not os.path.exists(snapshot_dir)
+    assert log_size(database) == logged
+    assert_current(cache, database)
+
+
+def test_recreated_database_is_not_served_from_the_old_snapshot(database, tmp_path):
+    snapshot_dir = str(tmp_path / "snapshot")
+    GalleryCache(database, snapshot_dir).refresh()
+
+    get_pool(database).close_all()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    create_db(database)
+    cache = GalleryCache(database, snapshot_dir)
+    assert cache.refresh()
+    assert len(cache.student_ids) == 0
+
+
+def test_refresh_requires_the_change_log_migration(tmp_path):
+    database = str(tmp_path / "old.db")
+    create_db(database, upgrade=False)
+    with pytest.raises(RuntimeError, match="Migrations"):
+        GalleryCache(database, str(tmp_path / "snapshot")).refresh()
@@ -0,0 +1,76 @@
+"""Gallery lookups compared with a brute-force distance scan"""
+import numpy as np
+import pytest
+
+from Backend.FaceRecognition.GalleryIndex import ENCODING_DIM, FaceGallery, IVFFaceGallery
+
+
+def random_gallery(size, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(scale=0.1, size=(size, ENCODING_DIM)).astype(np.float32)
+    return encodings, np.arange(1000, 1000 + size)
+
+
+def brute_force(encodings, query):
+    return np.sqrt(((encodings.astype(np.float64) - query) ** 2).sum(axis=1))
+
+
+def test_query_matches_brute_force():
+    encodings, student_ids = random_gallery(300)
+    gallery = FaceGallery(encodings, student_ids)
+    queries = encodings[:20] + np.random.default_rng(1).normal(scale=0.02, size=(20, ENCODING_DIM))
+
+    for query, matches in zip(queries, gallery.query_batch(queries, k=3, tolerance=False)):
+        distances = brute_force(encodings, query)
+        expected = np.argsort(distances)[:3]
+        assert [student_id for student_id, _ in matches] == student_ids[expected].tolist()
+        assert [d for _, d in matches] == pytest.approx(distances[expected].tolist(), abs=1e-4)
+
+
+def test_tolerance_filters_matches():
+    encodings, student_ids = random_gallery(50)
+    gallery = FaceGallery(encodings, student_ids, tolerance=0.5)
+
+    assert gallery.best_match(encodings[7])[0] == student_ids[7]
+    assert gallery.best_match(encodings[7] + 1.0) is None
+    assert gallery.query(encodings[7] + 1.0, tolerance=False)
+
+
+def test_empty_gallery_and_no_queries():
+    gallery = FaceGallery(np.zeros((0, ENCODING_DIM)), [])
+    assert gallery.query_batch(np.zeros((2, ENCODING_DIM))) == [[], []]
+    assert FaceGallery(*random_gallery(5)).query_batch(np.zeros((0, ENCODING_DIM))) == []
+
+
+def test_length_mismatch_is_rejected():
+    with pytest.raises(ValueError):
+        FaceGallery(np.zeros((3, ENCODING_DIM)), [1, 2])
+
+
+def test_ivf_probing_every_cell_is_exact():
+    encodings, student_ids = random_gallery(IVFFaceGallery.MIN_SIZE)
+    ivf = IVFFaceGallery(encodings, student_ids, n_lists=16, n_probe=16)
+    exact = FaceGallery(encodings, student_ids)
+    assert ivf.centroids is not None
+    # Rows are regrouped by cell: every encoding is still there once
+    assert sorted(ivf.student_ids.tolist()) == student_ids.tolist()
+
+    queries = encodings[::97]
+    for found, expected in zip(ivf.query_batch(queries, k=2, tolerance=False),
+                               exact.query_batch(queries, k=2, tolerance=False)):
+        assert [i for i, _ in found] == [i for i, _ in expected]
+
+
+def test_ivf_finds_the_gallery_rows_themselves():
+    encodings, student_ids = random_gallery(IVFFaceGallery.MIN_SIZE, seed=2)
+    ivf = IVFFaceGallery(encodings, student_ids, n_lists=32, n_probe=1)
+    # A row is always in the cell of its nearest centroid, the one probed first
+    for index in range(0, len(student_ids), 101):
+        assert ivf.best_match(encodings[index])[0] == student_ids[index]
+
+
+def test_small_ivf_gallery_scans_everything():
+    encodings, student_ids = random_gallery(100)
+    ivf = IVFFaceGallery(encodings, student_ids, n_probe=1)
+    assert ivf.centroids is None
+    assert ivf.query(encodings[3], k=1)[0][0] == student_ids[3]
@@ -0,0 +1,105 @@
+"""Schema migrations on a database created before they existed"""
+import sqlite3
+
+import pytest
+
+from Backend.Database.DataAccess import connection, init_app
+from Backend.Database.Migrations import LATEST_VERSION, MIGRATIONS, migrate, schema_version
+from Backend.Database.NewDataFile import create_db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Connection to a database with create_db's tables and no migrations"""
+    database = str(tmp_path / "school.db")
+    create_db(database, upgrade=False)
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+def add_student(conn, student_id, student_class):
+    conn.execute("""
+        INSERT INTO Students (StudentID, Name, RollNumber, Class, Gender, Teacher, Password)
+        VALUES (?, ?, ?, ?, 'F', 'teacher', 'secret')
+    """, (student_id, f"student {student_id}", student_id, student_class))
+
+
+def names(conn, kind):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def test_versions_are_consecutive():
+    assert [number for number, _, _ in MIGRATIONS] == list(range(1, LATEST_VERSION + 1))
+
+
+def test_migrate_reaches_latest_version(conn):
+    assert schema_version(conn) == 0
+    assert migrate(conn) == LATEST_VERSION
+    assert schema_version(conn) == LATEST_VERSION
+
+    assert {"StudentAttendanceSummary", "ClassDailyAttendance", "ClassAttendanceTotals",
+            "face_encodings_log"} <= names(conn, "table")
+    assert {"idx_attendance_student_status", "idx_attendance_student_date"} <= names(conn, "index")
+    assert {"attendance_summary_insert", "attendance_summary_update", "class_daily_update",
+            "class_totals_insert"} <= names(conn, "trigger")
+
+
+def test_migrate_again_does_nothing(conn):
+    migrate(conn)
+    schema = conn.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall()
+    assert migrate(conn) == LATEST_VERSION
+    assert conn.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall() == schema
+
+
+def test_database_without_tables_is_left_alone(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "empty.db"))
+    assert migrate(conn) == 0
+    assert names(conn, "table") == set()
+    conn.close()
+
+
+def test_duplicate_marks_keep_the_present_one(conn):
+    add_student(conn, 1, "5A")
+    conn.executemany("INSERT INTO Attendance (StudentID, Date, Status, Class) VALUES (1, '2026-01-05', ?, '5A')",
+                     [("Absent",), ("Present",), ("Present",)])
+    conn.commit()
+    migrate(conn)
+
+    assert conn.execute("SELECT Status FROM Attendance").fetchall() == [("Present",)]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO Attendance (StudentID, Date, Status, Class) VALUES (1, '2026-01-05', 'Present', '5A')")
+
+
+def test_existing_attendance_is_counted(conn):
+    for student_id, student_class in [(1, "5A"), (2, "5A"), (3, "6B")]:
+        add_student(conn, student_id, student_class)
+    conn.executemany("INSERT INTO SchoolDays (Date) VALUES (?)", [("2026-01-05",), ("2026-01-06",)])
+    conn.executemany("INSERT INTO Attendance (StudentID, Date, Status, Class) VALUES (?, ?, 'Present', ?)",
+                     [(1, "2026-01-05", "5A"), (1, "2026-01-06", "5A"), (2, "2026-01-06", "5A"),
+                      (3, "2026-01-05", "6B")])
+    conn.commit()
+    migrate(conn)
+
+    summary = conn.execute("SELECT * FROM StudentAttendanceSummary ORDER BY StudentID").fetchall()
+    assert summary == [(1, 2, "2026-01-06", 2, 2), (2, 1, "2026-01-06", 1, 1), (3, 1, "2026-01-05", 1, 1)]
+    daily = conn.execute("SELECT * FROM ClassDailyAttendance ORDER BY Class, Date").fetchall()
+    assert daily == [("5A", "2026-01-05", 1, 2), ("5A", "2026-01-06", 2, 2),
+                     ("6B", "2026-01-05", 1, 1), ("6B", "2026-01-06", 0, 1)]
+    totals = conn.execute("SELECT * FROM ClassAttendanceTotals ORDER BY Class").fetchall()
+    assert totals == [("5A", 3, 4), ("6B", 1, 2)]
+
+
+def test_init_app_migrates_before_serving(tmp_path):
+    database = str(tmp_path / "school.db")
+    create_db(database, upgrade=False)
+    teardowns = []
+
+    class App:
+        def teardown_appcontext(self, function):
+            teardowns.append(function)
+
+    init_app(App(), database)
+    with connection(database) as conn:
+        assert schema_version(conn) == LATEST_VERSION
+    assert teardowns
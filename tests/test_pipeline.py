@@ -0,0 +1,65 @@
+"""Bounded queues between the recognition stages"""
+import queue
+import threading
+
+import pytest
+
+from Backend.FaceRecognition.Pipeline import DropOldestQueue
+
+
+def test_full_queue_drops_the_oldest_item():
+    frames = DropOldestQueue(2)
+    for frame in range(5):
+        frames.put(frame)
+
+    assert len(frames) == 2
+    assert frames.dropped == 3
+    assert [frames.get(timeout=0), frames.get(timeout=0)] == [3, 4]
+    with pytest.raises(queue.Empty):
+        frames.get(timeout=0.01)
+
+
+def test_drained_counts_dropped_items_as_done():
+    frames = DropOldestQueue(1)
+    frames.put("old")
+    frames.put("new")
+    assert not frames.drained()
+
+    assert frames.get(timeout=0) == "new"
+    assert not frames.drained()  # taken but not finished yet
+    frames.task_done()
+    assert frames.drained()
+
+
+def test_waiting_queue_keeps_every_item():
+    frames = DropOldestQueue(1, drop_oldest=False)
+    received = []
+
+    def consume():
+        for _ in range(20):
+            received.append(frames.get(timeout=5))
+            frames.task_done()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for frame in range(20):
+        frames.put(frame)
+    consumer.join(5)
+
+    assert received == list(range(20))
+    assert frames.dropped == 0
+    assert frames.drained()
+
+
+def test_close_releases_a_waiting_producer():
+    frames = DropOldestQueue(1, drop_oldest=False)
+    frames.put("first")
+    producer = threading.Thread(target=frames.put, args=("second",))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()  # waiting for room
+
+    frames.close()
+    producer.join(5)
+    assert not producer.is_alive()
+    assert len(frames) == 1  # the late item was discarded